@@ -0,0 +1,277 @@
+"""
+Retrieval of the resource passages relevant to a turn.
+
+Inlining the full markdown of every resource into the system prompt makes the
+prompt grow with each resource. Instead, each thread keeps an index of its
+resources split into chunks, and a turn only gets the chunks that best match
+the latest user message and the research question by BM25, up to
+CONTEXT_TOP_K chunks and CONTEXT_TOKEN_BUDGET tokens. Resources that fit the
+budget as a whole are passed unchanged.
+
+The index is held as sorted (term, chunk, frequency) arrays, so scoring a
+query is a handful of vectorised NumPy operations over the postings of its
+terms. It is updated incrementally as resources are added or deleted, in the
+background once they are downloaded, and always off the event loop.
+"""
+import logging
+import os
+import asyncio
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from research_canvas.local_index import tokenize
+from research_canvas.search_payload import estimate_tokens
+
+_logger = logging.getLogger(__name__)
+
+_RETRIEVE_CONTEXT = os.getenv("RETRIEVE_CONTEXT", "true").lower() == "true"
+_CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "8"))
+_CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Target chunk size in characters; chunks break at paragraph boundaries where possible
+_CHUNK_CHARS = int(os.getenv("CONTEXT_CHUNK_CHARS", "1500"))
+# Number of thread indexes kept in memory
+_MAX_THREADS = int(os.getenv("CONTEXT_MAX_THREADS", "64"))
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def split_chunks(text: str, size: int = _CHUNK_CHARS) -> List[str]:
+    """
+    Split a text into chunks of about size characters along paragraph boundaries.
+    """
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > size:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = paragraph.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class ChunkIndex:
+    """
+    A BM25 index over the chunks of one thread's resources.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Content each URL was indexed from, to notice when a resource changes
+        self._contents: Dict[str, str] = {}
+        self._chunks: List[Tuple[str, str]] = []
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._vocabulary: Dict[str, int] = {}
+        # Postings sorted by term: term id, chunk id and term frequency
+        self._terms = np.zeros(0, dtype=np.int32)
+        self._chunk_ids = np.zeros(0, dtype=np.int32)
+        self._frequencies = np.zeros(0, dtype=np.float32)
+
+    def update(self, resources: List[Dict[str, Any]]):
+        """
+        Index new or changed resources and drop the ones no longer present.
+        """
+        contents = {
+            resource["url"]: resource.get("content") or ""
+            for resource in resources
+        }
+        with self._lock:
+            if contents == self._contents:
+                return
+            keep = [
+                i for i, (url, _) in enumerate(self._chunks)
+                if self._contents.get(url) == contents.get(url)
+            ]
+            chunks = [self._chunks[i] for i in keep]
+            lengths = [self._lengths[i] for i in keep]
+            postings = [
+                (self._terms, self._chunk_ids, self._frequencies)
+            ] if keep else []
+            if keep and len(keep) < len(self._chunks):
+                remap = np.full(len(self._chunks), -1, dtype=np.int32)
+                remap[keep] = np.arange(len(keep), dtype=np.int32)
+                chunk_ids = remap[self._chunk_ids]
+                live = chunk_ids >= 0
+                postings = [(self._terms[live], chunk_ids[live], self._frequencies[live])]
+
+            indexed = {url for url, _ in chunks}
+            for url, content in contents.items():
+                if url in indexed:
+                    continue
+                for chunk in split_chunks(content):
+                    counts = Counter(tokenize(chunk))
+                    chunk_id = len(chunks)
+                    chunks.append((url, chunk))
+                    lengths.append(sum(counts.values()))
+                    if not counts:
+                        continue
+                    postings.append((
+                        np.array(
+                            [self._vocabulary.setdefault(term, len(self._vocabulary))
+                             for term in counts],
+                            dtype=np.int32
+                        ),
+                        np.full(len(counts), chunk_id, dtype=np.int32),
+                        np.array(list(counts.values()), dtype=np.float32),
+                    ))
+
+            if postings:
+                terms = np.concatenate([p[0] for p in postings])
+                order = np.argsort(terms, kind="stable")
+                self._terms = terms[order]
+                self._chunk_ids = np.concatenate([p[1] for p in postings])[order]
+                self._frequencies = np.concatenate([p[2] for p in postings])[order]
+            else:
+                self._terms = np.zeros(0, dtype=np.int32)
+                self._chunk_ids = np.zeros(0, dtype=np.int32)
+                self._frequencies = np.zeros(0, dtype=np.float32)
+            self._chunks = chunks
+            self._lengths = np.array(lengths, dtype=np.float32)
+            self._contents = contents
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, str, float]]:
+        """
+        Get the top_k (url, chunk, score) matches for a query, best first.
+        """
+        with self._lock:
+            documents = len(self._chunks)
+            term_ids = sorted({
+                self._vocabulary[term] for term in tokenize(query)
+                if term in self._vocabulary
+            })
+            if not documents or not term_ids:
+                return []
+
+            scores = np.zeros(documents, dtype=np.float32)
+            norms = _BM25_K1 * (
+                1 - _BM25_B + _BM25_B * self._lengths / max(float(self._lengths.mean()), 1.0)
+            )
+            starts = np.searchsorted(self._terms, term_ids, side="left")
+            ends = np.searchsorted(self._terms, term_ids, side="right")
+            for start, end in zip(starts, ends):
+                if start == end:
+                    continue
+                chunk_ids = self._chunk_ids[start:end]
+                frequencies = self._frequencies[start:end]
+                idf = np.log(1 + (documents - (end - start) + 0.5) / (end - start + 0.5))
+                scores[chunk_ids] += idf * frequencies * (_BM25_K1 + 1) / (
+                    frequencies + norms[chunk_ids]
+                )
+
+            top_k = min(top_k, int(np.count_nonzero(scores)))
+            if top_k <= 0:
+                return []
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-scores[best])]
+            return [(*self._chunks[i], float(scores[i])) for i in best]
+
+
+_INDEXES: "OrderedDict[str, ChunkIndex]" = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+# Index updates in progress, referenced so they are not garbage collected
+_UPDATING: Set[asyncio.Task] = set()
+
+
+def get_chunk_index(thread_id: str) -> ChunkIndex:
+    """
+    Get the chunk index of a thread, evicting the least recently used ones.
+    """
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(thread_id)
+        if index is None:
+            index = _INDEXES[thread_id] = ChunkIndex()
+            while len(_INDEXES) > max(1, _MAX_THREADS):
+                _INDEXES.popitem(last=False)
+        else:
+            _INDEXES.move_to_end(thread_id)
+        return index
+
+
+def _total_tokens(resources: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(resource.get("content") or "") for resource in resources)
+
+
+def index_in_background(
+    thread_id: Optional[str],
+    load: Callable[[], Awaitable[List[Dict[str, Any]]]],
+    token_budget: int = _CONTEXT_TOKEN_BUDGET
+):
+    """
+    Bring a thread's chunk index up to date with the resources load returns,
+    so the next chat turn finds it built.
+    """
+    if not _RETRIEVE_CONTEXT:
+        return
+
+    async def run():
+        try:
+            resources = await load()
+            if _total_tokens(resources) > token_budget:
+                await asyncio.to_thread(get_chunk_index(thread_id or "default").update, resources)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error indexing the resources of thread {thread_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _UPDATING.add(task)
+    task.add_done_callback(_UPDATING.discard)
+
+
+async def select_relevant_content(
+    thread_id: Optional[str],
+    resources: List[Dict[str, Any]],
+    query: str,
+    top_k: int = _CONTEXT_TOP_K,
+    token_budget: int = _CONTEXT_TOKEN_BUDGET
+) -> List[Dict[str, Any]]:
+    """
+    Narrow the content of each resource to the chunks relevant to the query.
+    Every resource stays listed, with empty content if none of it is relevant.
+    """
+    total_tokens = _total_tokens(resources)
+    if not _RETRIEVE_CONTEXT or total_tokens <= token_budget:
+        return resources
+    return await asyncio.to_thread(
+        _select, thread_id, resources, query, top_k, token_budget, total_tokens
+    )
+
+
+def _select(
+    thread_id: Optional[str],
+    resources: List[Dict[str, Any]],
+    query: str,
+    top_k: int,
+    token_budget: int,
+    total_tokens: int
+) -> List[Dict[str, Any]]:
+    index = get_chunk_index(thread_id or "default")
+    # Usually a no-op, the index having been updated when the resources were downloaded
+    index.update(resources)
+
+    selected: Dict[str, List[str]] = {}
+    used_tokens = 0
+    for url, chunk, _ in index.search(query, top_k):
+        tokens = estimate_tokens(chunk)
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        selected.setdefault(url, []).append(chunk)
+
+    _logger.debug(f"Selected ~{used_tokens} of ~{total_tokens} resource tokens for the prompt")
+    return [
+        {**resource, "content": "\n\n[...]\n\n".join(selected.get(resource["url"], []))}
+        for resource in resources
+    ]
@@ -0,0 +1,124 @@
+"""
+HTML to markdown conversion off the event loop.
+
+html2text is pure Python and can take hundreds of milliseconds on a large
+page, so conversions run in a bounded process pool (RESOURCE_CONVERT_POOL=thread
+selects a thread pool instead, which is also used if processes are unavailable).
+Unless RESOURCE_EXTRACT_MAIN_CONTENT is off, boilerplate is stripped from the
+page in the same worker before it is converted.
+"""
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, NamedTuple, Optional
+import html2text
+from research_canvas.extract import extract_main_content
+
+_POOL_KIND = os.getenv("RESOURCE_CONVERT_POOL", "process")
+_POOL_SIZE = int(os.getenv("RESOURCE_CONVERT_WORKERS", str(min(2, os.cpu_count() or 1))))
+_EXTRACT_MAIN_CONTENT = os.getenv("RESOURCE_EXTRACT_MAIN_CONTENT", "true").lower() == "true"
+
+_EXECUTOR: Optional[Executor] = None
+_STATS = {
+    "conversions": 0,
+    "queue_seconds": 0.0,
+    "max_queue_seconds": 0.0,
+    "convert_seconds": 0.0,
+    "max_convert_seconds": 0.0,
+    "original_chars": 0,
+    "extracted_chars": 0,
+}
+
+
+class Conversion(NamedTuple):
+    """
+    A converted page, with the visible text size before and after extraction.
+    """
+    markdown: str
+    original_chars: int
+    extracted_chars: int
+    started_at: float
+    finished_at: float
+
+
+def _convert(html_content: str, extract: bool) -> Conversion:
+    """
+    Convert HTML to markdown, recording the wall-clock start and end of the work.
+    Runs inside the worker.
+    """
+    started_at = time.time()
+    original_chars = extracted_chars = len(html_content)
+    if extract:
+        html_content, original_chars, extracted_chars = extract_main_content(html_content)
+    markdown_content = html2text.html2text(html_content)
+    return Conversion(markdown_content, original_chars, extracted_chars, started_at, time.time())
+
+
+def _create_executor() -> Executor:
+    if _POOL_KIND == "process":
+        try:
+            return ProcessPoolExecutor(
+                max_workers=_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        except (OSError, NotImplementedError, ValueError) as e:
+            print(f"Process pool unavailable, converting in threads: {e}")
+    return ThreadPoolExecutor(max_workers=_POOL_SIZE, thread_name_prefix="html2text")
+
+
+def _get_executor() -> Executor:
+    global _EXECUTOR # pylint: disable=global-statement
+    if _EXECUTOR is None:
+        _EXECUTOR = _create_executor()
+    return _EXECUTOR
+
+
+async def html_to_markdown(html_content: str) -> Conversion:
+    """
+    Convert HTML to markdown in the worker pool.
+    """
+    global _EXECUTOR # pylint: disable=global-statement
+    loop = asyncio.get_running_loop()
+    submitted_at = time.time()
+    try:
+        conversion = await loop.run_in_executor(
+            _get_executor(), _convert, html_content, _EXTRACT_MAIN_CONTENT
+        )
+    except BrokenProcessPool:
+        print("Conversion process pool broke, falling back to threads")
+        _EXECUTOR = ThreadPoolExecutor(max_workers=_POOL_SIZE, thread_name_prefix="html2text")
+        conversion = await loop.run_in_executor(
+            _EXECUTOR, _convert, html_content, _EXTRACT_MAIN_CONTENT
+        )
+
+    queue_seconds = max(0.0, conversion.started_at - submitted_at)
+    convert_seconds = conversion.finished_at - conversion.started_at
+    _STATS["conversions"] += 1
+    _STATS["queue_seconds"] += queue_seconds
+    _STATS["max_queue_seconds"] = max(_STATS["max_queue_seconds"], queue_seconds)
+    _STATS["convert_seconds"] += convert_seconds
+    _STATS["max_convert_seconds"] = max(_STATS["max_convert_seconds"], convert_seconds)
+    _STATS["original_chars"] += conversion.original_chars
+    _STATS["extracted_chars"] += conversion.extracted_chars
+    return conversion
+
+
+def get_conversion_stats() -> Dict[str, Any]:
+    """
+    Get queue and conversion timings.
+    """
+    conversions = _STATS["conversions"]
+    return {
+        **_STATS,
+        "pool": type(_EXECUTOR).__name__ if _EXECUTOR else None,
+        "workers": _POOL_SIZE,
+        "avg_queue_seconds": _STATS["queue_seconds"] / conversions if conversions else 0.0,
+        "avg_convert_seconds": _STATS["convert_seconds"] / conversions if conversions else 0.0,
+        "extracted_ratio": (
+            _STATS["extracted_chars"] / _STATS["original_chars"]
+            if _STATS["original_chars"] else 1.0
+        ),
+    }
@@ -10,7 +10,11 @@ import os
 from portkey_ai import createHeaders, PORTKEY_GATEWAY_URL
 from research_canvas.crewai.download import download_resources, get_resources
 from research_canvas.crewai.delete import maybe_perform_delete
-from research_canvas.crewai.prompt import format_prompt
+from research_canvas.crewai.prompt import INSTRUCTIONS, format_prompt
+from research_canvas.prompt_budget import fit_prompt
+from research_canvas.history import compact_history
+from research_canvas.prompt_layout import build_chat_messages, record_stream_usage
+from research_canvas.hedging import hedged_completion, HEDGE_MODEL, HEDGE_PORTKEY_CONFIG
 from research_canvas.crewai.tools import (
     SEARCH_TOOL,
     WRITE_REPORT_TOOL,
@@ -46,11 +50,13 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
         """
         Listen for the download event.
         """
-        resources = get_resources(self.state)
-        prompt = format_prompt(
+        resources = await get_resources(self.state)
+        fitted = fit_prompt(
+            format_prompt("", "", []),
             self.state["research_question"],
             self.state["report"],
-            resources
+            resources,
+            compact_history(self.state["messages"])
         )
 
         await copilotkit_predict_state(
@@ -81,26 +87,48 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
         if portkey_config:
             portkey_headers["x-portkey-config"] = portkey_config
         
-        response = await copilotkit_stream(
-            completion(
+        completion_kwargs = {
+            "messages": build_chat_messages(
+                INSTRUCTIONS,
+                self.state["research_question"],
+                fitted.report,
+                fitted.resources,
+                fitted.messages
+            ),
+            "tools": [
+                SEARCH_TOOL,
+                WRITE_REPORT_TOOL,
+                WRITE_RESEARCH_QUESTION_TOOL,
+                DELETE_RESOURCES_TOOL
+            ],
+            "parallel_tool_calls": False,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            "api_key": portkey_api_key,
+            "base_url": PORTKEY_GATEWAY_URL,
+        }
+
+        # Backup for hedged requests, each setting falling back to the primary's
+        backup_headers = {
+            **portkey_headers,
+            **({"x-portkey-config": HEDGE_PORTKEY_CONFIG} if HEDGE_PORTKEY_CONFIG else {})
+        }
+
+        stream = await hedged_completion(
+            lambda: completion(
                 model=f"openai/{model_name}",
-                messages=[
-                    {"role": "system", "content": prompt},
-                    *self.state["messages"]
-                ],
-                tools=[
-                    SEARCH_TOOL,
-                    WRITE_REPORT_TOOL,
-                    WRITE_RESEARCH_QUESTION_TOOL,
-                    DELETE_RESOURCES_TOOL
-                ],
-                parallel_tool_calls=False,
-                stream=True,
-                api_key=portkey_api_key,
-                base_url=PORTKEY_GATEWAY_URL,
-                headers=portkey_headers
-            )
+                headers=portkey_headers,
+                **completion_kwargs
+            ),
+            lambda: completion(
+                model=f"openai/{HEDGE_MODEL or model_name}",
+                headers=backup_headers,
+                **completion_kwargs
+            ),
+            fitted.breakdown["total"]
         )
+        response = await copilotkit_stream(stream)
+        await record_stream_usage(stream)
         message = cast(Any, response).choices[0]["message"]
 
         self.state["messages"].append(message)
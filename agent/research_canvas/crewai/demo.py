@@ -10,8 +10,9 @@ import uvicorn
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 from copilotkit import CopilotKitRemoteEndpoint, CrewAIAgent
 from research_canvas.crewai.agent import ResearchCanvasFlow
+from research_canvas.http_client import http_client_lifespan
 
-app = FastAPI()
+app = FastAPI(lifespan=http_client_lifespan)
 sdk = CopilotKitRemoteEndpoint(
     agents=[
         CrewAIAgent(
@@ -1,41 +1,12 @@
 """
 Utility functions for downloading resources.
 """
-import aiohttp
-import html2text
 from typing_extensions import Dict, Any
 from copilotkit.crewai import copilotkit_emit_state
 from research_canvas.crewai.tools import prepare_state_for_serialization
-
-_RESOURCE_CACHE = {}
-
-def get_resource(url: str):
-    """
-    Get a resource from the cache.
-    """
-    return _RESOURCE_CACHE.get(url, "")
-
-_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
-
-async def _download_resource(url: str):
-    """
-    Download a resource from the internet asynchronously.
-    """
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={"User-Agent": _USER_AGENT},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                markdown_content = html2text.html2text(html_content)
-                _RESOURCE_CACHE[url] = markdown_content
-                return markdown_content
-    except Exception as e: # pylint: disable=broad-except
-        _RESOURCE_CACHE[url] = "ERROR"
-        return f"Error downloading resource: {e}"
+from research_canvas.resource_service import has_resource, load_resources, download_as_completed
+from research_canvas.chunk_index import select_relevant_content, index_in_background
+from research_canvas.summaries import use_summaries
 
 
 async def download_resources(state: Dict[str, Any]):
@@ -50,7 +21,7 @@ async def download_resources(state: Dict[str, Any]):
 
     # Find resources that are not downloaded
     for resource in state["resources"]:
-        if not get_resource(resource["url"]):
+        if not has_resource(resource["url"]):
             resources_to_download.append(resource)
             state["logs"].append({
                 "message": f"Downloading {resource['url']}",
@@ -61,28 +32,41 @@ async def download_resources(state: Dict[str, Any]):
     serializable_state = prepare_state_for_serialization(state)
     await copilotkit_emit_state(serializable_state)
 
-    # Download the resources
-    for i, resource in enumerate(resources_to_download):
-        await _download_resource(resource["url"])
+    # Download the resources concurrently, marking each one done as it completes
+    urls = [resource["url"] for resource in resources_to_download]
+    async for i in download_as_completed(urls):
         state["logs"][logs_offset + i]["done"] = True
 
         # Prepare serializable state and update UI
         serializable_state = prepare_state_for_serialization(state)
         await copilotkit_emit_state(serializable_state)
 
-def get_resources(state: Dict[str, Any]):
-    """
-    Get the resources from the state.
-    """
-    resources = []
+    if urls:
+        # Chunk the new resources before the chat turn needs them
+        resources = list(state["resources"])
 
-    for resource in state["resources"]:
-        content = get_resource(resource["url"])
-        if content == "ERROR":
-            continue
-        resources.append({
-            **resource,
-            "content": content
-        })
+        async def load():
+            return use_summaries(await load_resources(resources))
+
+        index_in_background(state.get("id"), load)
 
-    return resources
+
+async def get_resources(state: Dict[str, Any]):
+    """
+    Get the resources from the state, summarised where they are large and
+    narrowed to the parts relevant to the latest user message.
+    """
+    resources = use_summaries(await load_resources(state["resources"]))
+    user_message = next(
+        (
+            message.get("content") or ""
+            for message in reversed(state.get("messages", []))
+            if isinstance(message, dict) and message.get("role") == "user"
+        ),
+        ""
+    )
+    return await select_relevant_content(
+        state.get("id"),
+        resources,
+        f"{user_message}\n{state.get('research_question', '')}"
+    )
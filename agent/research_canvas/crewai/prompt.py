@@ -3,6 +3,16 @@ Prompt
 """
 
 from typing_extensions import Dict, Any, List
+from research_canvas.prompt_layout import format_context
+
+INSTRUCTIONS = """
+You are a research assistant. You help the user with writing a research report.
+Do not recite the resources, instead use them to answer the user's question.
+You should use the search tool to get resources before answering the user's question.
+If you finished writing the report, ask the user proactively for next steps, changes etc, make it engaging.
+To write the report, you should use the WriteReport tool. Never EVER respond with the report, only use the tool.
+If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
+"""
 
 def format_prompt(
     research_question: str,
@@ -10,23 +20,7 @@ def format_prompt(
     resources: List[Dict[str, Any]]
 ):
     """
-    Format the main prompt.
+    Format the main prompt, stable instructions first.
     """
 
-    return f"""
-        You are a research assistant. You help the user with writing a research report.
-        Do not recite the resources, instead use them to answer the user's question.
-        You should use the search tool to get resources before answering the user's question.
-        If you finished writing the report, ask the user proactively for next steps, changes etc, make it engaging.
-        To write the report, you should use the WriteReport tool. Never EVER respond with the report, only use the tool.
-        If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
-
-        This is the research question:
-        {research_question}
-
-        This is the research report:
-        {report}
-
-        Here are the resources that you have available:
-        {resources}
-    """
\ No newline at end of file
+    return f"{INSTRUCTIONS}\n{format_context(research_question, report, resources)}"
@@ -4,17 +4,18 @@ Tools
 import os
 import json
 from typing_extensions import Dict, Any, List, cast
-from tavily import TavilyClient
 from copilotkit.crewai import copilotkit_emit_state, copilotkit_predict_state, copilotkit_stream
 from litellm import completion
 from litellm.types.utils import Message as LiteLLMMessage, ChatCompletionMessageToolCall
 # Import Portkey utilities for OpenAI model integration
 from portkey_ai import createHeaders, PORTKEY_GATEWAY_URL
+from research_canvas.resource_service import prefetch_resource
+from research_canvas.search_service import search_as_completed
+from research_canvas.search_payload import compact_search_results
+from research_canvas.ranking import choose_resources
 
 HITL_TOOLS = ["DeleteResources"]
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-
 # Custom JSON encoder to handle Message objects
 class MessageEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -145,6 +146,8 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     state["resources"] = state.get("resources", [])
     state["logs"] = state.get("logs", [])
 
+    logs_offset = len(state["logs"])
+
     for query in queries:
         state["logs"].append({
             "message": f"Search for {query}",
@@ -155,74 +158,90 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     serializable_state = prepare_state_for_serialization(state)
     await copilotkit_emit_state(serializable_state)
 
-    search_results = []
+    search_results = [None] * len(queries)
 
-    for i, query in enumerate(queries):
-        response = tavily_client.search(query)
-        search_results.append(response)
-        state["logs"][i]["done"] = True
+    # Run the searches concurrently, marking each one done as it returns
+    known_urls = [resource["url"] for resource in state.get("resources", [])]
+    async for i, response in search_as_completed(queries, known_urls):
+        search_results[i] = response
+        state["logs"][logs_offset + i]["done"] = True
         # Use the prepared state for serialization
         serializable_state = prepare_state_for_serialization(state)
         await copilotkit_emit_state(serializable_state)
 
-    await copilotkit_predict_state(
-        {
-            "resources": {
-                "tool_name": "ExtractResources",
-                "tool_argument": "resources",
-            },
-        }
+    resources = choose_resources(
+        "crewai",
+        search_results,
+        queries,
+        state.get("research_question", ""),
+        (resource["url"] for resource in state["resources"])
     )
+    if resources is None:
+        await copilotkit_predict_state(
+            {
+                "resources": {
+                    "tool_name": "ExtractResources",
+                    "tool_argument": "resources",
+                },
+            }
+        )
 
-    # Get Portkey configuration from environment variables
-    portkey_api_key = os.getenv("PORTKEY_API_KEY")
-    portkey_config = os.getenv("PORTKEY_OPENAI_CONFIG")
-    model_name = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        # Get Portkey configuration from environment variables
+        portkey_api_key = os.getenv("PORTKEY_API_KEY")
+        portkey_config = os.getenv("PORTKEY_OPENAI_CONFIG")
+        model_name = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     
-    # Create Portkey headers
-    portkey_headers = createHeaders(
-        api_key=portkey_api_key,
-        provider="openai"  # Using OpenAI as the provider
-    )
+        # Create Portkey headers
+        portkey_headers = createHeaders(
+            api_key=portkey_api_key,
+            provider="openai"  # Using OpenAI as the provider
+        )
     
-    # Add config to headers if provided
-    if portkey_config:
-        portkey_headers["x-portkey-config"] = portkey_config
+        # Add config to headers if provided
+        if portkey_config:
+            portkey_headers["x-portkey-config"] = portkey_config
     
-    # Configure LiteLLM with Portkey
-    response = await copilotkit_stream(
-    completion(
-        model=f"openai/{model_name}",
-        messages=[
-            {
-                "role": "system", 
-                "content": "You need to extract the 3-5 most relevant resources from the following search results."
-            },
-            *state["messages"],
-            {
-                "role": "tool",
-                "content": f"Performed search: {search_results}",
-                "tool_call_id": tool_call_id
-            }
-        ],
-        tools=[EXTRACT_RESOURCES_TOOL],
-        tool_choice="required",
-        parallel_tool_calls=False,
-        stream=True,
-        api_key=portkey_api_key,
-        base_url=PORTKEY_GATEWAY_URL,
-        headers=portkey_headers
-    )
-    )
+        # Configure LiteLLM with Portkey
+        response = await copilotkit_stream(
+        completion(
+            model=f"openai/{model_name}",
+            messages=[
+                {
+                    "role": "system", 
+                    "content": "You need to extract the 3-5 most relevant resources from the following search results."
+                },
+                *state["messages"],
+                {
+                    "role": "tool",
+                    "content": (
+                        "Performed search:\n"
+                        f"{compact_search_results(search_results, state['resources'])}"
+                    ),
+                    "tool_call_id": tool_call_id
+                }
+            ],
+            tools=[EXTRACT_RESOURCES_TOOL],
+            tool_choice="required",
+            parallel_tool_calls=False,
+            stream=True,
+            api_key=portkey_api_key,
+            base_url=PORTKEY_GATEWAY_URL,
+            headers=portkey_headers
+        )
+        )
+
+        message = cast(Any, response).choices[0]["message"]
+        resources = json.loads(message["tool_calls"][0]["function"]["arguments"])["resources"]
+
+    # Start the downloads right away instead of waiting for the flow to route back
+    for resource in resources:
+        prefetch_resource(resource["url"])
 
     state["logs"] = []
     # Use the prepared state for serialization
     serializable_state = prepare_state_for_serialization(state)
     await copilotkit_emit_state(serializable_state)
 
-    message = cast(Any, response).choices[0]["message"]
-    resources = json.loads(message["tool_calls"][0]["function"]["arguments"])["resources"]
-
     state["resources"].extend(resources)
 
     state["messages"].append({
@@ -13,6 +13,9 @@ from research_canvas.crewai_qwen3.qwen3_chat import Qwen3ChatOpenAI
 from research_canvas.crewai_qwen3.download import download_resources, get_resources
 from research_canvas.crewai_qwen3.delete import maybe_perform_delete
 from research_canvas.crewai_qwen3.prompt import format_prompt
+from research_canvas.prompt_budget import fit_prompt
+from research_canvas.history import compact_history
+from research_canvas.prompt_layout import record_stream_usage
 from research_canvas.crewai_qwen3.tools import (
     SEARCH_TOOL,
     WRITE_REPORT_TOOL,
@@ -48,10 +51,17 @@ class ResearchCanvasQwen3Flow(Flow[Dict[str, Any]]):
         Listen for the download event.
         """
         resources = get_resources(self.state)
-        prompt = format_prompt(
+        fitted = fit_prompt(
+            format_prompt("", "", []),
             self.state["research_question"],
             self.state["report"],
-            resources
+            resources,
+            compact_history(self.state["messages"])
+        )
+        prompt = format_prompt(
+            self.state["research_question"],
+            fitted.report,
+            fitted.resources
         )
 
         await copilotkit_predict_state(
@@ -88,27 +98,28 @@ class ResearchCanvasQwen3Flow(Flow[Dict[str, Any]]):
             # Convert messages to Qwen3 format
             messages = [
                 {"role": "system", "content": prompt},
-                *self.state["messages"]
+                *fitted.messages
             ]
             qwen3_messages = qwen3_chat._create_message_dicts(messages)
             
-            response = await copilotkit_stream(
-                completion(
-                    model="openai/qwen3-30b-a3b-fp8",  # Use Qwen3 model
-                    messages=qwen3_messages,
-                    tools=[
-                        SEARCH_TOOL,
-                        WRITE_REPORT_TOOL,
-                        WRITE_RESEARCH_QUESTION_TOOL,
-                        DELETE_RESOURCES_TOOL
-                    ],
-                    parallel_tool_calls=False,
-                    stream=True,
-                    api_key=portkey_api_key,
-                    base_url=PORTKEY_GATEWAY_URL,
-                    headers=portkey_headers
-                )
+            stream = completion(
+                model="openai/qwen3-30b-a3b-fp8",  # Use Qwen3 model
+                messages=qwen3_messages,
+                tools=[
+                    SEARCH_TOOL,
+                    WRITE_REPORT_TOOL,
+                    WRITE_RESEARCH_QUESTION_TOOL,
+                    DELETE_RESOURCES_TOOL
+                ],
+                parallel_tool_calls=False,
+                stream=True,
+                stream_options={"include_usage": True},
+                api_key=portkey_api_key,
+                base_url=PORTKEY_GATEWAY_URL,
+                headers=portkey_headers
             )
+            response = await copilotkit_stream(stream)
+            await record_stream_usage(stream)
             raw_message = cast(Any, response).choices[0]["message"]
             
             # Check if the message contains tool calls in Qwen3's XML format
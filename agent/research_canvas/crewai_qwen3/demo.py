@@ -5,6 +5,7 @@ from typing_extensions import Dict, Any, List, cast
 from crewai.flow.flow import Flow
 from copilotkit.crewai import copilotkit_emit_state
 from research_canvas.crewai_qwen3.agent import ResearchCanvasQwen3Flow
+from research_canvas.http_client import http_client_lifespan
 
 class ResearchAgentCrewAIQwen3:
     """
@@ -25,8 +26,9 @@ class ResearchAgentCrewAIQwen3:
         state["messages"] = state.get("messages", [])
         state["messages"].append({"role": "user", "content": state["research_question"]})
 
-        # Run the flow
-        await self.flow.run(state)
+        # Run the flow, closing the pooled HTTP session once it is done
+        async with http_client_lifespan(None):
+            await self.flow.run(state)
 
         # Return the state
         return state
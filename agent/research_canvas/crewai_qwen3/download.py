@@ -1,41 +1,10 @@
 """
 Utility functions for downloading resources.
 """
-import aiohttp
-import html2text
 from typing_extensions import Dict, Any
 from copilotkit.crewai import copilotkit_emit_state
 from research_canvas.crewai_qwen3.tools import prepare_state_for_serialization
-
-_RESOURCE_CACHE = {}
-
-def get_resource(url: str):
-    """
-    Get a resource from the cache.
-    """
-    return _RESOURCE_CACHE.get(url, "")
-
-_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
-
-async def _download_resource(url: str):
-    """
-    Download a resource from the internet asynchronously.
-    """
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={"User-Agent": _USER_AGENT},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                markdown_content = html2text.html2text(html_content)
-                _RESOURCE_CACHE[url] = markdown_content
-                return markdown_content
-    except Exception as e: # pylint: disable=broad-except
-        _RESOURCE_CACHE[url] = "ERROR"
-        return f"Error downloading resource: {e}"
+from research_canvas.resource_service import has_resource, without_failed, download_as_completed
 
 
 async def download_resources(state: Dict[str, Any]):
@@ -50,7 +19,7 @@ async def download_resources(state: Dict[str, Any]):
 
     # Find resources that are not downloaded
     for resource in state["resources"]:
-        if not get_resource(resource["url"]):
+        if not has_resource(resource["url"]):
             resources_to_download.append(resource)
             state["logs"].append({
                 "message": f"Downloading {resource['url']}",
@@ -61,9 +30,9 @@ async def download_resources(state: Dict[str, Any]):
     serializable_state = prepare_state_for_serialization(state)
     await copilotkit_emit_state(serializable_state)
 
-    # Download the resources
-    for i, resource in enumerate(resources_to_download):
-        await _download_resource(resource["url"])
+    # Download the resources concurrently, marking each one done as it completes
+    urls = [resource["url"] for resource in resources_to_download]
+    async for i in download_as_completed(urls):
         state["logs"][logs_offset + i]["done"] = True
 
         # Prepare serializable state and update UI
@@ -72,17 +41,7 @@ async def download_resources(state: Dict[str, Any]):
 
 def get_resources(state: Dict[str, Any]):
     """
-    Get the resources from the state.
+    Get the resources from the state. The Qwen3 prompt lists the resources
+    without their content, so it is not loaded.
     """
-    resources = []
-
-    for resource in state["resources"]:
-        content = get_resource(resource["url"])
-        if content == "ERROR":
-            continue
-        resources.append({
-            **resource,
-            "content": content
-        })
-
-    return resources
+    return [{**resource, "content": ""} for resource in without_failed(state["resources"])]
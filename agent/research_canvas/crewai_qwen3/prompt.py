@@ -24,14 +24,9 @@ def format_prompt(research_question: str, report: str, resources: List[Dict[str,
             resources_text += f"   URL: {resource.get('url', '')}\n"
             resources_text += f"   Description: {resource.get('description', '')}\n\n"
     
+    # Stable instructions first, so provider prompt caches can reuse them across turns
     prompt = f"""You are a helpful research assistant. Your goal is to help the user research a topic and write a report.
 
-Current Research Question: {research_question if research_question else "No research question yet. You can help the user define one."}
-
-Current Report: {report if report else "No report yet. You can help the user write one."}
-
-{resources_text}
-
 You can use the following tools:
 1. Search - to search for information on the web
 2. WriteReport - to write or update the research report
@@ -39,6 +34,12 @@ You can use the following tools:
 4. DeleteResources - to delete resources that are not helpful
 
 Respond to the user in a helpful and informative way. If they ask a question, try to answer it based on the resources you have. If you don't have enough information, use the Search tool to find more information.
+
+Current Research Question: {research_question if research_question else "No research question yet. You can help the user define one."}
+
+{resources_text}
+
+Current Report: {report if report else "No report yet. You can help the user write one."}
 """
     
     return prompt
@@ -6,18 +6,18 @@ import os
 import json
 import re
 from typing_extensions import Dict, Any, List, cast
-from tavily import TavilyClient
 from copilotkit.crewai import copilotkit_emit_state, copilotkit_predict_state, copilotkit_stream
 from litellm import completion
 from litellm.types.utils import Message as LiteLLMMessage, ChatCompletionMessageToolCall
 # Import Portkey utilities for Qwen3 model integration
 from portkey_ai import createHeaders, PORTKEY_GATEWAY_URL
 from research_canvas.crewai_qwen3.qwen3_chat import Qwen3ChatOpenAI
+from research_canvas.resource_service import prefetch_resource
+from research_canvas.search_service import search_as_completed
+from research_canvas.ranking import rank_resources
 
 HITL_TOOLS = ["DeleteResources"]
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-
 # Custom JSON encoder to handle Message objects
 class MessageEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -215,6 +215,8 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     state["resources"] = state.get("resources", [])
     state["logs"] = state.get("logs", [])
 
+    logs_offset = len(state["logs"])
+
     for query in queries:
         state["logs"].append({
             "message": f"Search for {query}",
@@ -225,12 +227,13 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     serializable_state = prepare_state_for_serialization(state)
     await copilotkit_emit_state(serializable_state)
 
-    search_results = []
+    search_results = [None] * len(queries)
 
-    for i, query in enumerate(queries):
-        response = tavily_client.search(query)
-        search_results.append(response)
-        state["logs"][i]["done"] = True
+    # Run the searches concurrently, marking each one done as it returns
+    known_urls = [resource["url"] for resource in state.get("resources", [])]
+    async for i, response in search_as_completed(queries, known_urls):
+        search_results[i] = response
+        state["logs"][logs_offset + i]["done"] = True
         # Use the prepared state for serialization
         serializable_state = prepare_state_for_serialization(state)
         await copilotkit_emit_state(serializable_state)
@@ -264,58 +267,24 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     # For simplicity and to avoid API errors, let's manually extract resources from search results
     # instead of using the model to extract them
     try:
-        # Extract resources directly from search results without calling the model
-        extracted_resources = []
-        for result_set in search_results:
-            # Print the raw result set to debug
-            print(f"Raw result set keys: {result_set.keys()}")
-            
-            results = result_set.get("results", [])
-            # Take the top 3-5 results from each search query
-            for i, result in enumerate(results[:min(5, len(results))]):
-                # Print the raw result to debug
-                print(f"Raw search result {i}: {result}")
-                
-                # Create a resource object that exactly matches the expected UI structure
-                # The UI expects only url, title, and description fields
-                
-                # For Tavily API, the description is usually in the 'content' field
-                description = None
-                if "content" in result:
-                    description = result["content"]
-                elif "snippet" in result:
-                    description = result["snippet"]
-                elif "description" in result:
-                    description = result["description"]
-                else:
-                    # If no description field is found, create one from available data
-                    description = f"Source: {result.get('source', 'Unknown')}. "
-                    if "published_date" in result:
-                        description += f"Published: {result['published_date']}. "
-                    description += "No detailed description available."
-                
-                # Ensure description is not empty
-                if not description or description.strip() == "":
-                    description = "No description available."
-                
-                resource = {
-                    "url": result.get("url", ""),
-                    "title": result.get("title", "") or "Untitled Resource",
-                    "description": description
-                }
-                
-                # Print the formatted resource for debugging
-                print(f"Formatted resource {i}: {resource}")
-                
-                # Only add if we have a URL and it's not already in the resources
-                if resource["url"] and not any(r.get("url") == resource["url"] for r in extracted_resources):
-                    extracted_resources.append(resource)
-        
-        # Limit to 5 resources total
-        resources = extracted_resources[:5]
+        # Rank the search results directly instead of calling the model
+        ranking = rank_resources(
+            search_results,
+            queries,
+            state.get("research_question", ""),
+            (resource["url"] for resource in state["resources"])
+        )
+        resources = ranking.resources
+
+        # Start the downloads right away instead of waiting for the flow to route back
+        for resource in resources:
+            prefetch_resource(resource["url"])
         
         # Log the extraction for debugging
-        print(f"Extracted {len(resources)} resources directly from search results")
+        print(
+            f"Extracted {len(resources)} resources directly from search results "
+            f"(confidence {ranking.confidence:.2f})"
+        )
         
         state["logs"] = []
         # Use the prepared state for serialization
@@ -0,0 +1,151 @@
+"""
+Content-addressed, compressed storage for cached resource bodies.
+
+Identical bodies fetched from different URLs (mirrors, syndicated articles)
+are stored once, keyed by their SHA-256, and kept compressed at rest with
+zstd when the zstandard package is installed, zlib otherwise. Bodies are
+only decompressed when they are read.
+"""
+import os
+import zlib
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+from research_canvas.resource_cache import ResourceCache
+
+try:
+    import zstandard
+except ImportError: # pragma: no cover - optional dependency
+    zstandard = None
+
+_COMPRESSION = os.getenv(
+    "RESOURCE_CACHE_COMPRESSION", "zstd" if zstandard is not None else "zlib"
+)
+
+
+class DocumentStore:
+    """
+    Reference-counted store of compressed documents keyed by content hash.
+    """
+
+    def __init__(self, compression: str = _COMPRESSION):
+        if compression == "zstd" and zstandard is None:
+            compression = "zlib"
+        self.compression = compression
+        self.raw_bytes = 0
+        self.resident_bytes = 0
+        self.deduplicated = 0
+        # digest -> (compressed body, raw size, reference count)
+        self._documents: Dict[str, Tuple[bytes, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        if self.compression == "zlib":
+            return zlib.compress(data, 6)
+        return data
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        if self.compression == "zlib":
+            return zlib.decompress(data)
+        return data
+
+    def put(self, text: str) -> Tuple[str, int]:
+        """
+        Store a document, or take another reference to an identical one.
+        Returns its digest and compressed size.
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            document = self._documents.get(digest)
+            if document is not None:
+                compressed, raw_size, references = document
+                self._documents[digest] = (compressed, raw_size, references + 1)
+                self.deduplicated += 1
+                return digest, len(compressed)
+
+        compressed = self._compress(data)
+        with self._lock:
+            document = self._documents.get(digest)
+            if document is not None:
+                # Stored by another thread while we were compressing
+                compressed, raw_size, references = document
+                self._documents[digest] = (compressed, raw_size, references + 1)
+                self.deduplicated += 1
+                return digest, len(compressed)
+            self._documents[digest] = (compressed, len(data), 1)
+            self.raw_bytes += len(data)
+            self.resident_bytes += len(compressed)
+        return digest, len(compressed)
+
+    def get(self, digest: str) -> Optional[str]:
+        """
+        Get a document by digest, decompressing it.
+        """
+        with self._lock:
+            document = self._documents.get(digest)
+        if document is None:
+            return None
+        return self._decompress(document[0]).decode("utf-8")
+
+    def release(self, digest: str):
+        """
+        Drop a reference to a document, removing it once nothing refers to it.
+        """
+        with self._lock:
+            document = self._documents.get(digest)
+            if document is None:
+                return
+            compressed, raw_size, references = document
+            if references > 1:
+                self._documents[digest] = (compressed, raw_size, references - 1)
+                return
+            del self._documents[digest]
+            self.raw_bytes -= raw_size
+            self.resident_bytes -= len(compressed)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size of the store.
+        """
+        return {
+            "compression": self.compression,
+            "documents": len(self._documents),
+            "raw_bytes": self.raw_bytes,
+            "resident_bytes": self.resident_bytes,
+            "compression_ratio": (
+                self.raw_bytes / self.resident_bytes if self.resident_bytes else 1.0
+            ),
+            "deduplicated": self.deduplicated,
+        }
+
+
+class DocumentCache(ResourceCache):
+    """
+    A ResourceCache whose values live compressed and deduplicated in a DocumentStore.
+    The byte budget counts the compressed size of each entry.
+    """
+
+    def __init__(self, store: Optional[DocumentStore] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store or DocumentStore()
+
+    def _encode(self, key: str, value: Any) -> Tuple[Any, int]:
+        digest, compressed_size = self.store.put(value)
+        return digest, len(key) + len(digest) + compressed_size
+
+    def _decode(self, stored: Any) -> Any:
+        return self.store.get(stored)
+
+    def _discard(self, stored: Any):
+        self.store.release(stored)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "store": self.store.stats(),
+        }
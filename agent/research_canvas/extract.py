@@ -0,0 +1,161 @@
+"""
+Main-content extraction for downloaded pages.
+
+Strips navigation, cookie banners, footers, sidebars and similar boilerplate
+and, where the page marks it up, keeps only the <main> / <article> body, so
+that less text ends up in the prompt. Falls back to the whole page whenever
+the extraction looks like it threw away the actual content.
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+from typing import List, NamedTuple, Optional, Tuple
+
+# Elements that never carry article text
+_SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "aside", "form", "button", "select", "dialog",
+}
+# Elements whose text is never shown, so it does not count towards the page text
+_INVISIBLE_TAGS = {"script", "style", "noscript", "template"}
+# Page chrome, unless it sits inside the main content (e.g. an article's own header)
+_CHROME_TAGS = {"header", "footer"}
+_SKIP_ROLES = {
+    "navigation", "banner", "contentinfo", "complementary", "search", "dialog", "alert",
+}
+_BOILERPLATE = re.compile(
+    r"(?:^|[\s_-])("
+    r"cookies?|consent|gdpr|banner|navbar|nav|menu|breadcrumbs?|footer|sidebar|"
+    r"related|recommended|share|sharing|social|subscribe|newsletter|promo|"
+    r"advert|ads?|sponsored|comments?|popup|modal|signup"
+    r")(?:$|[\s_-])"
+)
+# Containers judged by their content only, never dropped for their class names
+_NEVER_SKIP = {"html", "body", "main", "article"}
+_MAIN_TAGS = {"main", "article"}
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+}
+_KEEP_ATTRS = {"href", "src", "alt", "title"}
+
+# A main region is only trusted if it has at least this much text
+_MIN_MAIN_CHARS = 500
+# ... and the extraction is only trusted if it keeps this share of the page text
+_MIN_KEPT_RATIO = 0.1
+
+
+class Extraction(NamedTuple):
+    """
+    The extracted HTML and how much visible text it kept.
+    """
+    html: str
+    original_chars: int
+    extracted_chars: int
+
+
+class _Extractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.text_chars = 0
+        self.total_chars = 0
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._invisible_depth = 0
+        # (tag, depth, output index, text chars) of each open <main>/<article>
+        self._open_regions: List[Tuple[str, int, int, int]] = []
+        self._region_depth = {tag: 0 for tag in _MAIN_TAGS}
+        # (output start, output end, text chars) of each closed region
+        self.regions: List[Tuple[int, int, int]] = []
+
+    def _is_boilerplate(self, tag: str, attrs) -> bool:
+        if tag in _SKIP_TAGS:
+            return True
+        if tag in _CHROME_TAGS and not self._open_regions:
+            return True
+        if tag in _NEVER_SKIP:
+            return False
+        attributes = dict(attrs)
+        if "hidden" in attributes or attributes.get("aria-hidden") == "true":
+            return True
+        if (attributes.get("role") or "").lower() in _SKIP_ROLES:
+            return True
+        names = f"{attributes.get('class') or ''} {attributes.get('id') or ''}".lower()
+        return bool(_BOILERPLATE.search(names))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _INVISIBLE_TAGS:
+            self._invisible_depth += 1
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if self._is_boilerplate(tag, attrs):
+            if tag not in _VOID_TAGS:
+                self._skip_tag = tag
+                self._skip_depth = 1
+            return
+        if tag in _MAIN_TAGS:
+            self._region_depth[tag] += 1
+            self._open_regions.append(
+                (tag, self._region_depth[tag], len(self.out), self.text_chars)
+            )
+        kept = "".join(
+            f' {name}="{escape(value or "")}"' for name, value in attrs if name in _KEEP_ATTRS
+        )
+        self.out.append(f"<{tag}{kept}>")
+
+    def handle_endtag(self, tag):
+        if tag in _INVISIBLE_TAGS and self._invisible_depth > 0:
+            self._invisible_depth -= 1
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in _VOID_TAGS:
+            return
+        self.out.append(f"</{tag}>")
+        if tag in _MAIN_TAGS and self._region_depth[tag] > 0:
+            depth = self._region_depth[tag]
+            for i in range(len(self._open_regions) - 1, -1, -1):
+                region_tag, region_depth, start, text_start = self._open_regions[i]
+                if region_tag == tag and region_depth == depth:
+                    del self._open_regions[i]
+                    self.regions.append((start, len(self.out), self.text_chars - text_start))
+                    break
+            self._region_depth[tag] -= 1
+
+    def handle_data(self, data):
+        chars = len(data.strip())
+        if self._invisible_depth == 0:
+            # Visible text, whether it is kept or dropped as boilerplate
+            self.total_chars += chars
+        if self._skip_tag is not None:
+            return
+        self.text_chars += chars
+        self.out.append(escape(data, quote=False))
+
+
+def extract_main_content(html_content: str) -> Extraction:
+    """
+    Strip boilerplate from a page and keep its main content.
+    """
+    parser = _Extractor()
+    try:
+        parser.feed(html_content)
+        parser.close()
+    except Exception: # pylint: disable=broad-except
+        return Extraction(html_content, 0, 0)
+
+    html_out, extracted_chars = "".join(parser.out), parser.text_chars
+    if parser.regions:
+        start, end, chars = max(parser.regions, key=lambda region: region[2])
+        if chars >= _MIN_MAIN_CHARS:
+            html_out, extracted_chars = "".join(parser.out[start:end]), chars
+
+    if extracted_chars < parser.total_chars * _MIN_KEPT_RATIO:
+        return Extraction(html_content, parser.total_chars, parser.total_chars)
+    return Extraction(html_out, parser.total_chars, extracted_chars)
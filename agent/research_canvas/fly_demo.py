@@ -15,8 +15,14 @@ from copilotkit.crewai import CrewAIAgent
 from research_canvas.crewai.agent import ResearchCanvasFlow
 from research_canvas.crewai_qwen3.agent import ResearchCanvasQwen3Flow
 from research_canvas.langgraph.agent import graph
+from research_canvas.http_client import http_client_lifespan
+from research_canvas.resource_service import get_resource_stats
+from research_canvas.search_service import get_search_stats
+from research_canvas.prompt_layout import get_prompt_cache_stats
+from research_canvas.history import get_history_stats
+from research_canvas.hedging import get_hedging_stats
 
-app = FastAPI()
+app = FastAPI(lifespan=http_client_lifespan)
 
 # Add CORS middleware to allow requests from your UI
 app.add_middleware(
@@ -98,6 +104,17 @@ def health():
     """Health check."""
     return {"status": "ok"}
 
+@app.get("/stats")
+async def stats():
+    """Resource fetching, search and prompt metrics."""
+    return {
+        "resources": get_resource_stats(),
+        "search": get_search_stats(),
+        "prompt_cache": get_prompt_cache_stats(),
+        "history": get_history_stats(),
+        "hedging": get_hedging_stats(),
+    }
+
 
 def main():
     """Run the uvicorn server."""
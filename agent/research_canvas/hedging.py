@@ -0,0 +1,193 @@
+"""
+Hedged model requests.
+
+Occasionally a request through the gateway takes tens of seconds to produce
+its first token. When LLM_HEDGE_TTFT is set (in seconds) and a backup is
+configured (LLM_HEDGE_PORTKEY_CONFIG and/or LLM_HEDGE_MODEL), a request that
+has not produced its first token within that time is sent a second time to
+the backup. Whichever stream produces output first is used and the other
+one is cancelled.
+
+Every hedge costs an extra request; its prompt tokens are counted as the
+added cost, next to how often each side won, so the threshold can be tuned.
+"""
+import os
+import asyncio
+import itertools
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from langchain_core.messages import message_chunk_to_message
+
+_HEDGE_TTFT = float(os.getenv("LLM_HEDGE_TTFT", "0"))
+HEDGE_PORTKEY_CONFIG = os.getenv("LLM_HEDGE_PORTKEY_CONFIG", "")
+HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")
+
+_STATS = {
+    "requests": 0,
+    "hedged": 0,
+    "primary_wins": 0,
+    "backup_wins": 0,
+    "extra_prompt_tokens": 0,
+}
+
+
+def hedging_enabled() -> bool:
+    """
+    Whether requests are hedged.
+    """
+    return _HEDGE_TTFT > 0 and bool(HEDGE_PORTKEY_CONFIG or HEDGE_MODEL)
+
+
+async def _hedge(
+    primary: Callable[[], Awaitable[Any]],
+    backup: Callable[[], Awaitable[Any]],
+    prompt_tokens: int
+) -> Any:
+    """
+    Start primary, and backup as well if primary has not finished within the
+    TTFT threshold. Returns the result of whichever finishes first and cancels
+    the other, which must clean up after itself.
+    """
+    _STATS["requests"] += 1
+    primary_task = asyncio.ensure_future(primary())
+    done, _ = await asyncio.wait({primary_task}, timeout=_HEDGE_TTFT)
+    if done:
+        # Not hedged, so not counted as a win
+        return primary_task.result()
+
+    print(f"No first token after {_HEDGE_TTFT}s, hedging with the backup model")
+    _STATS["hedged"] += 1
+    _STATS["extra_prompt_tokens"] += prompt_tokens
+    backup_task = asyncio.ensure_future(backup())
+    pending = {primary_task, backup_task}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (primary_task, backup_task):
+                if task in done and task.exception() is None:
+                    _STATS["primary_wins" if task is primary_task else "backup_wins"] += 1
+                    return task.result()
+        # Both failed
+        return primary_task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _first_chunk(runnable: Any, messages: Any, config: Any) -> Tuple[AsyncIterator, Any]:
+    """
+    Start streaming a LangChain runnable and wait for its first chunk.
+    """
+    stream = runnable.astream(messages, config).__aiter__()
+    try:
+        return stream, await stream.__anext__()
+    except BaseException:
+        await stream.aclose()
+        raise
+
+
+async def hedged_ainvoke(
+    runnable: Any,
+    backup: Optional[Any],
+    messages: Any,
+    config: Any,
+    prompt_tokens: int = 0
+) -> Any:
+    """
+    Invoke a LangChain runnable, hedging with the backup runnable if it is slow
+    to produce its first token. Like ainvoke, returns a complete message.
+    The backup runs without the config's callbacks, so it streams nothing to
+    the UI while it races the primary.
+    """
+    if backup is None or not hedging_enabled():
+        _STATS["requests"] += 1
+        return await runnable.ainvoke(messages, config)
+
+    backup_config = {**(config or {}), "callbacks": None}
+    stream, response = await _hedge(
+        lambda: _first_chunk(runnable, messages, config),
+        lambda: _first_chunk(backup, messages, backup_config),
+        prompt_tokens
+    )
+    async for chunk in stream:
+        response = response + chunk
+    return message_chunk_to_message(response)
+
+
+def _close_completion(raw: Any):
+    close = getattr(raw, "close", None)
+    if close is not None:
+        close()
+
+
+def _wait_for_first_chunk(stream: Any) -> Tuple[Any, Any]:
+    """
+    Wait for the first raw chunk of a LiteLLM stream, then put it back in front
+    of the rest, so the stream is returned unchanged and unread.
+    Returns the stream and its raw stream.
+    """
+    raw = stream.completion_stream
+    if not hasattr(raw, "__next__"):
+        # Already complete, e.g. a cached response
+        return stream, raw
+    try:
+        first = next(raw)
+    except StopIteration:
+        return stream, raw
+    stream.completion_stream = itertools.chain([first], raw)
+    return stream, raw
+
+
+def _start_completion(start: Callable[[], Any]) -> Callable[[], Awaitable[Any]]:
+    def open_stream():
+        return _wait_for_first_chunk(start())
+
+    async def run():
+        # LiteLLM's synchronous streams block, so they are started and read in a
+        # thread, which cannot be interrupted: a stream that loses is closed
+        # once the thread returns
+        future = asyncio.ensure_future(asyncio.to_thread(open_stream))
+        try:
+            stream, _ = await asyncio.shield(future)
+            return stream
+        except asyncio.CancelledError:
+            future.add_done_callback(
+                lambda f: _close_completion(f.result()[1])
+                if not f.cancelled() and f.exception() is None else None
+            )
+            raise
+    return run
+
+
+async def hedged_completion(
+    start: Callable[[], Any],
+    start_backup: Optional[Callable[[], Any]],
+    prompt_tokens: int = 0
+) -> Any:
+    """
+    Start a streaming LiteLLM completion, hedging with the backup completion if
+    it is slow to produce its first token. The winning stream is returned
+    unread, ready for copilotkit_stream.
+    """
+    if start_backup is None or not hedging_enabled():
+        _STATS["requests"] += 1
+        return start()
+
+    return await _hedge(
+        _start_completion(start),
+        _start_completion(start_backup),
+        prompt_tokens
+    )
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """
+    Get how often requests were hedged, which side won the hedged ones and
+    the extra prompt tokens sent.
+    """
+    hedged = _STATS["hedged"]
+    return {
+        **_STATS,
+        "enabled": hedging_enabled(),
+        "ttft_threshold": _HEDGE_TTFT,
+        "backup_win_rate": _STATS["backup_wins"] / hedged if hedged else 0.0,
+    }
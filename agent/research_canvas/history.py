@@ -0,0 +1,211 @@
+"""
+Compaction of the message history sent with each chat call.
+
+Long threads accumulate tool results such as "Added the following resources:
+[...]" and WriteReport calls that each carry a full copy of an old report.
+The resources and the current report are already in the system prompt, so
+before the latest user message (HISTORY_COMPACTION, on by default):
+
+    - tool results longer than HISTORY_TOOL_STUB_CHARS are cut to a short stub
+    - WriteReport arguments are replaced with a note that the draft was superseded
+
+With HISTORY_ROLLUP on, turns before the last HISTORY_KEEP_TURNS user
+messages are also replaced with a summary, produced in the background and
+cached by the content of the turns it covers.
+
+State is never changed; only the messages sent to the model are compacted.
+"""
+import logging
+import os
+import json
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Set
+from research_canvas.resource_cache import ResourceCache
+from research_canvas.prompt_budget import message_tokens
+from research_canvas.summaries import summarise
+
+_logger = logging.getLogger(__name__)
+
+_COMPACTION = os.getenv("HISTORY_COMPACTION", "true").lower() == "true"
+_TOOL_STUB_CHARS = int(os.getenv("HISTORY_TOOL_STUB_CHARS", "200"))
+_ROLLUP = os.getenv("HISTORY_ROLLUP", "false").lower() == "true"
+_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+
+_SUPERSEDED_REPORT = "[superseded report draft omitted; the current report is in the system prompt]"
+_ROLLUP_PROMPT = """
+Summarise this earlier part of a conversation between a user and a research assistant
+in at most 200 words. Keep the user's requests, decisions and preferences.
+"""
+
+# Hash of the rolled-up messages -> summary
+_ROLLUPS = ResourceCache(max_bytes=4 * 1024 * 1024)
+_IN_FLIGHT: Set[str] = set()
+_TASKS: Set[asyncio.Task] = set()
+_STATS = {
+    "compactions": 0,
+    "tokens_before": 0,
+    "tokens_after": 0,
+    "rollups": 0,
+}
+
+
+def _role(message: Any) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "")
+    role = getattr(message, "role", None) or getattr(message, "type", "")
+    return {"human": "user", "ai": "assistant"}.get(role, role)
+
+
+def _content(message: Any) -> Any:
+    if isinstance(message, dict):
+        return message.get("content")
+    return getattr(message, "content", None)
+
+
+def _with_content(message: Any, content: str) -> Any:
+    if isinstance(message, dict):
+        return {**message, "content": content}
+    if hasattr(message, "model_copy"):
+        return message.model_copy(update={"content": content})
+    return {"role": _role(message), "content": content,
+            "tool_call_id": getattr(message, "tool_call_id", None)}
+
+
+def _stub_report_calls(message: Any) -> Any:
+    """
+    Replace the report argument of WriteReport calls in an assistant message.
+    """
+    tool_calls = (
+        message.get("tool_calls") if isinstance(message, dict)
+        else getattr(message, "tool_calls", None)
+    )
+    if not tool_calls:
+        return message
+
+    if not isinstance(message, dict) and hasattr(message, "additional_kwargs"):
+        # LangChain message: parsed tool calls
+        if not any(call["name"] == "WriteReport" for call in tool_calls):
+            return message
+        return message.model_copy(update={"tool_calls": [
+            {**call, "args": {"report": _SUPERSEDED_REPORT}}
+            if call["name"] == "WriteReport" else call
+            for call in tool_calls
+        ]})
+
+    # OpenAI style message, as a dict or a LiteLLM object: JSON arguments
+    calls = []
+    changed = False
+    for call in tool_calls:
+        if not isinstance(call, dict):
+            call = {
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.function.name, "arguments": call.function.arguments},
+            }
+        if call.get("function", {}).get("name") == "WriteReport":
+            call = {**call, "function": {
+                **call["function"],
+                "arguments": json.dumps({"report": _SUPERSEDED_REPORT}),
+            }}
+            changed = True
+        calls.append(call)
+    if not changed:
+        return message
+    fields = message if isinstance(message, dict) else {
+        "role": "assistant", "content": _content(message) or ""
+    }
+    return {**fields, "tool_calls": calls}
+
+
+def _stub_message(message: Any) -> Any:
+    role = _role(message)
+    if role == "tool":
+        content = _content(message)
+        if isinstance(content, str) and len(content) > _TOOL_STUB_CHARS:
+            return _with_content(message, content[:_TOOL_STUB_CHARS] + " [...omitted]")
+        return message
+    if role == "assistant":
+        return _stub_report_calls(message)
+    return message
+
+
+def _render(messages: List[Any]) -> str:
+    return "\n".join(f"{_role(message)}: {_content(message) or ''}" for message in messages)
+
+
+def _rollup(messages: List[Any]) -> List[Any]:
+    """
+    Replace turns before the last HISTORY_KEEP_TURNS user messages with their
+    summary once it is ready, starting to produce it otherwise.
+    """
+    user_turns = [i for i, message in enumerate(messages) if _role(message) == "user"]
+    if len(user_turns) <= _KEEP_TURNS:
+        return messages
+    cut = user_turns[-_KEEP_TURNS]
+    text = _render(messages[:cut])
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    summary = _ROLLUPS.get(key)
+    if summary is not None:
+        _STATS["rollups"] += 1
+        return [
+            {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"},
+            *messages[cut:],
+        ]
+
+    if key not in _IN_FLIGHT:
+        _IN_FLIGHT.add(key)
+
+        async def run():
+            try:
+                _ROLLUPS[key] = await summarise(text, _ROLLUP_PROMPT)
+            except Exception as e: # pylint: disable=broad-except
+                print(f"Error summarising the conversation: {e}")
+            finally:
+                _IN_FLIGHT.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        _TASKS.add(task)
+        task.add_done_callback(_TASKS.discard)
+    return messages
+
+
+def compact_history(messages: List[Any]) -> List[Any]:
+    """
+    Get the message history to send to the model, with stale payloads stubbed.
+    """
+    if not _COMPACTION or not messages:
+        return list(messages)
+
+    last_user = max(
+        (i for i, message in enumerate(messages) if _role(message) == "user"), default=0
+    )
+    compacted = [_stub_message(message) for message in messages[:last_user]]
+    compacted.extend(messages[last_user:])
+    if _ROLLUP:
+        compacted = _rollup(compacted)
+
+    before = sum(message_tokens(message) for message in messages)
+    after = sum(message_tokens(message) for message in compacted)
+    _STATS["compactions"] += 1
+    _STATS["tokens_before"] += before
+    _STATS["tokens_after"] += after
+    if after < before:
+        _logger.debug(f"Compacted history from {before} to {after} tokens")
+    return compacted
+
+
+def get_history_stats() -> Dict[str, Any]:
+    """
+    Get the token reduction achieved by history compaction.
+    """
+    return {
+        **_STATS,
+        "enabled": _COMPACTION,
+        "rollup": _ROLLUP,
+        "reduction": (
+            1 - _STATS["tokens_after"] / _STATS["tokens_before"]
+            if _STATS["tokens_before"] else 0.0
+        ),
+    }
@@ -0,0 +1,195 @@
+"""
+Process-wide pooled HTTP client used to fetch resources.
+
+All download modules share one aiohttp session so that DNS lookups, TCP
+connections and TLS sessions are reused across resources and threads.
+The FastAPI apps open and close it in their lifespan; when no lifespan runs
+(e.g. under the LangGraph dev server) it is created lazily on first use.
+"""
+import os
+import re
+import codecs
+from contextlib import asynccontextmanager
+from typing import List, NamedTuple, Optional
+import aiohttp
+from research_canvas.loop_registry import LoopRegistry
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
+
+# Total number of pooled connections
+_POOL_SIZE = int(os.getenv("RESOURCE_HTTP_POOL_SIZE", "100"))
+# Connections allowed to a single host at once
+_POOL_SIZE_PER_HOST = int(os.getenv("RESOURCE_HTTP_POOL_SIZE_PER_HOST", "8"))
+# Seconds a DNS lookup is cached
+_DNS_CACHE_TTL = int(os.getenv("RESOURCE_HTTP_DNS_CACHE_TTL", "300"))
+# Seconds an idle keep-alive connection stays in the pool
+_KEEPALIVE_TIMEOUT = float(os.getenv("RESOURCE_HTTP_KEEPALIVE_TIMEOUT", "30"))
+# Seconds a single resource fetch may take
+_FETCH_TIMEOUT = float(os.getenv("RESOURCE_HTTP_TIMEOUT", "10"))
+# Bytes read from a single resource; longer bodies are truncated to this prefix
+_FETCH_MAX_BYTES = int(os.getenv("RESOURCE_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+_CHUNK_SIZE = 64 * 1024
+
+# Content types worth converting to markdown
+_TEXT_CONTENT_TYPES = (
+    "text/",
+    "application/xhtml+xml",
+    "application/xml",
+    "application/json",
+)
+# How far into the body to look for a <meta charset> declaration
+_CHARSET_SNIFF_BYTES = 4096
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+# aiohttp sessions are bound to the event loop they were created on
+_SESSIONS: LoopRegistry[aiohttp.ClientSession] = LoopRegistry()
+# Lifespans running on each loop; the session is closed when the last one ends
+_LIFESPANS: LoopRegistry[List[int]] = LoopRegistry()
+
+
+def _create_session() -> aiohttp.ClientSession:
+    """
+    Create a new pooled session.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=_POOL_SIZE,
+        limit_per_host=_POOL_SIZE_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=_DNS_CACHE_TTL,
+        keepalive_timeout=_KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+def get_http_client() -> aiohttp.ClientSession:
+    """
+    Get the shared session for the running event loop, creating it if needed.
+    """
+    return _SESSIONS.get(_create_session, lambda session: not session.closed)
+
+
+async def close_http_client():
+    """
+    Close the shared session for the running event loop.
+    """
+    session = _SESSIONS.pop()
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@asynccontextmanager
+async def http_client_lifespan(_app):
+    """
+    FastAPI lifespan that owns the shared session. It can also wrap a single
+    agent run; nested and concurrent lifespans on a loop share the session.
+    """
+    get_http_client()
+    running = _LIFESPANS.get(lambda: [0])
+    running[0] += 1
+    try:
+        yield
+    finally:
+        running[0] -= 1
+        if not running[0]:
+            await close_http_client()
+
+
+class UnsupportedContentType(Exception):
+    """
+    Raised when a resource is not a text document.
+    """
+
+
+class FetchResult(NamedTuple):
+    """
+    The outcome of fetching a resource.
+    """
+    status: int
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    truncated: bool = False
+
+    @property
+    def not_modified(self) -> bool:
+        """
+        Whether the server confirmed the cached copy is still current.
+        """
+        return self.status == 304
+
+
+def _is_text(response: aiohttp.ClientResponse) -> bool:
+    # A missing content type is common enough on small sites to give it a try;
+    # aiohttp reports it as application/octet-stream, so check the header itself
+    if not response.headers.get("Content-Type"):
+        return True
+    return response.content_type.startswith(_TEXT_CONTENT_TYPES)
+
+
+def _charset(header_charset: Optional[str], body: bytes) -> str:
+    """
+    Pick the charset from the headers or a <meta> tag, without content sniffing.
+    """
+    candidates = [header_charset]
+    match = _META_CHARSET.search(body[:_CHARSET_SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+async def fetch_text(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> FetchResult:
+    """
+    Fetch a resource as text through the shared session.
+    Passing the validators of a cached copy makes the request conditional.
+    The body is streamed and cut off after RESOURCE_FETCH_MAX_BYTES.
+    Raises on HTTP errors, timeouts and non-text content.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with get_http_client().get(
+        url,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=_FETCH_TIMEOUT)
+    ) as response:
+        if response.status == 304:
+            return FetchResult(304, "", etag, last_modified)
+        response.raise_for_status()
+        if not _is_text(response):
+            raise UnsupportedContentType(f"Unsupported content type {response.content_type}")
+
+        body = bytearray()
+        truncated = False
+        async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+            body.extend(chunk)
+            if len(body) >= _FETCH_MAX_BYTES:
+                # Leaving the context early closes the connection instead of draining it
+                truncated = len(body) > _FETCH_MAX_BYTES or not response.content.at_eof()
+                del body[_FETCH_MAX_BYTES:]
+                break
+
+        raw = bytes(body)
+        return FetchResult(
+            response.status,
+            raw.decode(_charset(response.charset, raw), errors="replace"),
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            truncated,
+        )
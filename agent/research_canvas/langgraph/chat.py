@@ -2,13 +2,29 @@
 
 from typing import List, cast, Literal
 from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import SystemMessage, AIMessage, ToolMessage
+from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
 from langchain.tools import tool
 from langgraph.types import Command
 from copilotkit.langgraph import copilotkit_customize_config
 from research_canvas.langgraph.state import AgentState
-from research_canvas.langgraph.model import get_model
-from research_canvas.langgraph.download import get_resource
+from research_canvas.langgraph.model import get_model, get_backup_model, bind_tools
+from research_canvas.resource_service import load_resources
+from research_canvas.chunk_index import select_relevant_content
+from research_canvas.summaries import use_summaries
+from research_canvas.prompt_budget import fit_prompt
+from research_canvas.history import compact_history
+from research_canvas.prompt_layout import build_chat_messages, format_context, record_prompt_usage
+from research_canvas.hedging import hedged_ainvoke
+
+
+_INSTRUCTIONS = """
+You are a research assistant. You help the user with writing a research report.
+Do not recite the resources, instead use them to answer the user's question.
+You should use the search tool to get resources before answering the user's question.
+If you finished writing the report, ask the user proactively for next steps, changes etc, make it engaging.
+To write the report, you should use the WriteReport tool. Never EVER respond with the report, only use the tool.
+If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
+"""
 
 
 @tool
@@ -51,16 +67,24 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
     research_question = state.get("research_question", "")
     report = state.get("report", "")
 
-    resources = []
+    resources = use_summaries(await load_resources(state["resources"]))
+    # Only pass the parts of the resources relevant to this turn
+    user_message = next(
+        (m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), ""
+    )
+    resources = await select_relevant_content(
+        config.get("configurable", {}).get("thread_id"),
+        resources,
+        f"{user_message}\n{research_question}"
+    )
 
-    for resource in state["resources"]:
-        content = get_resource(resource["url"])
-        if content == "ERROR":
-            continue
-        resources.append({
-            **resource,
-            "content": content
-        })
+    fitted = fit_prompt(
+        _INSTRUCTIONS + format_context("", "", []),
+        research_question,
+        report,
+        resources,
+        compact_history(state["messages"])
+    )
 
     model = get_model(state)
     # Prepare the kwargs for the ainvoke method
@@ -68,36 +92,31 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> \
     if model.__class__.__name__ in ["ChatOpenAI"]:
         ainvoke_kwargs["parallel_tool_calls"] = False
 
-    response = await model.bind_tools(
-        [
-            Search,
-            WriteReport,
-            WriteResearchQuestion,
-            DeleteResources,
-        ],
-        **ainvoke_kwargs  # Pass the kwargs conditionally
-    ).ainvoke([
-        SystemMessage(
-            content=f"""
-            You are a research assistant. You help the user with writing a research report.
-            Do not recite the resources, instead use them to answer the user's question.
-            You should use the search tool to get resources before answering the user's question.
-            If you finished writing the report, ask the user proactively for next steps, changes etc, make it engaging.
-            To write the report, you should use the WriteReport tool. Never EVER respond with the report, only use the tool.
-            If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
-
-            This is the research question:
-            {research_question}
-
-            This is the research report:
-            {report}
-
-            Here are the resources that you have available:
-            {resources}
-            """
+    tools = [
+        Search,
+        WriteReport,
+        WriteResearchQuestion,
+        DeleteResources,
+    ]
+    backup = get_backup_model(state)
+    response = await hedged_ainvoke(
+        bind_tools(
+            model,
+            tools,
+            **ainvoke_kwargs  # Pass the kwargs conditionally
         ),
-        *state["messages"],
-    ], config)
+        bind_tools(backup, tools, **ainvoke_kwargs) if backup is not None else None,
+        build_chat_messages(
+            _INSTRUCTIONS,
+            research_question,
+            fitted.report,
+            fitted.resources,
+            fitted.messages
+        ),
+        config,
+        fitted.breakdown["total"]
+    )
+    record_prompt_usage(response)
 
     ai_message = cast(AIMessage, response)
 
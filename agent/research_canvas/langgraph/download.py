@@ -2,42 +2,12 @@
 This module contains the implementation of the download_node function.
 """
 
-import aiohttp
-import html2text
 from copilotkit.langgraph import copilotkit_emit_state
 from langchain_core.runnables import RunnableConfig
 from research_canvas.langgraph.state import AgentState
-
-_RESOURCE_CACHE = {}
-
-def get_resource(url: str):
-    """
-    Get a resource from the cache.
-    """
-    return _RESOURCE_CACHE.get(url, "")
-
-
-_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
-
-async def _download_resource(url: str):
-    """
-    Download a resource from the internet asynchronously.
-    """
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={"User-Agent": _USER_AGENT},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                markdown_content = html2text.html2text(html_content)
-                _RESOURCE_CACHE[url] = markdown_content
-                return markdown_content
-    except Exception as e: # pylint: disable=broad-except
-        _RESOURCE_CACHE[url] = "ERROR"
-        return f"Error downloading resource: {e}"
+from research_canvas.resource_service import has_resource, load_resources, download_as_completed
+from research_canvas.summaries import use_summaries
+from research_canvas.chunk_index import index_in_background
 
 async def download_node(state: AgentState, config: RunnableConfig):
     """
@@ -51,7 +21,7 @@ async def download_node(state: AgentState, config: RunnableConfig):
 
     # Find resources that are not downloaded
     for resource in state["resources"]:
-        if not get_resource(resource["url"]):
+        if not has_resource(resource["url"]):
             resources_to_download.append(resource)
             state["logs"].append({
                 "message": f"Downloading {resource['url']}",
@@ -61,12 +31,21 @@ async def download_node(state: AgentState, config: RunnableConfig):
     # Emit the state to let the UI update
     await copilotkit_emit_state(config, state)
 
-    # Download the resources
-    for i, resource in enumerate(resources_to_download):
-        await _download_resource(resource["url"])
+    # Download the resources concurrently, marking each one done as it completes
+    urls = [resource["url"] for resource in resources_to_download]
+    async for i in download_as_completed(urls):
         state["logs"][logs_offset + i]["done"] = True
 
         # update UI
         await copilotkit_emit_state(config, state)
 
+    if urls:
+        # Chunk the new resources before the chat turn needs them
+        resources = list(state["resources"])
+
+        async def load():
+            return use_summaries(await load_resources(resources))
+
+        index_in_background(config.get("configurable", {}).get("thread_id"), load)
+
     return state
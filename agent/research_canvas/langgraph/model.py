@@ -1,33 +1,148 @@
 """
 This module provides a function to get a model based on the configuration.
 """
+import logging
 import os
-from typing import cast, Any
+import threading
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
 from research_canvas.langgraph.state import AgentState
+from research_canvas.hedging import hedging_enabled
+from research_canvas.loop_registry import LoopRegistry
 # Import Portkey utilities for the OpenAI model
 from portkey_ai import createHeaders, PORTKEY_GATEWAY_URL
 
+_logger = logging.getLogger(__name__)
+
+# Environment variables that change how a model is built
+_MODEL_SETTINGS = (
+    "PORTKEY_API_KEY",
+    "PORTKEY_OPENAI_CONFIG",
+    "PORTKEY_GEMINI25FLASH_CONFIG",
+    "OPENAI_MODEL",
+    "LLM_HEDGE_PORTKEY_CONFIG",
+    "LLM_HEDGE_MODEL",
+)
+
+
+class GeminiChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that truncates tool call IDs to the 40 characters Gemini accepts.
+    """
+
+    def _create_message_dicts(self, messages, stop=None):
+        message_dicts = super()._create_message_dicts(messages, stop=stop)
+
+        # Truncate tool call IDs if they exist
+        for message in message_dicts:
+            if message.get("role") == "assistant" and message.get("tool_calls"):
+                for tool_call in message["tool_calls"]:
+                    if len(tool_call.get("id", "")) > 40:
+                        tool_call["id"] = tool_call["id"][:40]
+                        print(f"Truncated tool call ID to: {tool_call['id']}")
+
+        return message_dicts
+
+
+class _Entry(NamedTuple):
+    settings: Tuple[Optional[str], ...]
+    model: BaseChatModel
+    # Tool-bound runnables of the model, by tools and binding options
+    bound: Dict[Hashable, Runnable]
+
+
+# Models are reused across calls, so their HTTP connection pools to the gateway
+# are too; the pools belong to the event loop they were opened on
+_MODELS: LoopRegistry[Dict[Tuple[Optional[str], bool], _Entry]] = LoopRegistry()
+_MODELS_LOCK = threading.Lock()
+
+
 def get_model(state: AgentState) -> BaseChatModel:
-    print("get_model received state:", state)
     """
-    Get a model based on the environment variable.
+    Get a model based on the environment variable, building it only when it is
+    first used or its configuration changed.
     """
 
     state_model = state.get("model")
     model = os.getenv("MODEL", state_model)
+    return _get_entry(model).model
+
+
+def get_backup_model(state: AgentState) -> Optional[BaseChatModel]:
+    """
+    Get the backup that slow requests to the model of get_model are hedged
+    with, if hedging is on. It is the same kind of model, built with
+    LLM_HEDGE_PORTKEY_CONFIG and LLM_HEDGE_MODEL where they are set.
+    """
+    if not hedging_enabled():
+        return None
+    state_model = state.get("model")
+    model = os.getenv("MODEL", state_model)
+    return _get_entry(model, backup=True).model
+
 
-    print(f"Using model: {model}")
+def _get_entry(model: Optional[str], backup: bool = False) -> _Entry:
+    key = (model, backup)
+    settings = tuple(os.getenv(name) for name in _MODEL_SETTINGS)
+    with _MODELS_LOCK:
+        entries = _MODELS.get(dict)
+        entry = entries.get(key)
+        if entry is None or entry.settings != settings:
+            entry = entries[key] = _Entry(settings, _build_model(model, backup), {})
+        return entry
+
+
+def bind_tools(model: BaseChatModel, tools: List[Any], **kwargs) -> Runnable:
+    """
+    Bind tools to a model from get_model, reusing the runnable of an earlier
+    call with the same tools and options.
+    """
+    signature = (
+        tuple(getattr(tool, "name", tool) for tool in tools),
+        tuple(sorted((name, repr(value)) for name, value in kwargs.items())),
+    )
+    with _MODELS_LOCK:
+        entry = next(
+            (entry for entries in _MODELS.values() for entry in entries.values() if entry.model is model),
+            None,
+        )
+        if entry is None:
+            return model.bind_tools(tools, **kwargs)
+        runnable = entry.bound.get(signature)
+        if runnable is None:
+            runnable = entry.bound[signature] = model.bind_tools(tools, **kwargs)
+        return runnable
+
+
+def _hedge_setting(name: str, default: Optional[str], backup: bool) -> Optional[str]:
+    """
+    Get a setting of the backup model, falling back to the primary's.
+    """
+    if backup and os.getenv(name):
+        return os.getenv(name)
+    return default
+
+
+def _build_model(model: Optional[str], backup: bool = False) -> BaseChatModel:
+    """
+    Build the model for a model setting, or its backup for hedged requests.
+    """
+
+    _logger.debug(f"Using {'backup ' if backup else ''}model: {model}")
 
     if model == "model1":
-        from langchain_openai import ChatOpenAI
-        
         # Get Portkey API key from environment
         portkey_api_key = os.getenv("PORTKEY_API_KEY")
         # Get Portkey config if using configs instead of direct provider routing
-        portkey_config = os.getenv("PORTKEY_OPENAI_CONFIG")
+        portkey_config = _hedge_setting(
+            "LLM_HEDGE_PORTKEY_CONFIG", os.getenv("PORTKEY_OPENAI_CONFIG"), backup
+        )
         # Model name is required but ignored
-        model_name = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        model_name = _hedge_setting(
+            "LLM_HEDGE_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini"), backup
+        )
         
         # Create Portkey headers
         portkey_headers = createHeaders(
@@ -44,7 +159,9 @@ def get_model(state: AgentState) -> BaseChatModel:
             model=model_name,
             api_key=portkey_api_key,  # Use Portkey API key here
             base_url=PORTKEY_GATEWAY_URL,
-            default_headers=portkey_headers
+            default_headers=portkey_headers,
+            # Report token usage, including cached input tokens, when streaming
+            stream_usage=True
         )
     # Model3 has been removed as it was not working properly
     if model == "model2":
@@ -53,26 +170,11 @@ def get_model(state: AgentState) -> BaseChatModel:
         # Get Portkey API key from environment
         portkey_api_key = os.getenv("PORTKEY_API_KEY")
         # Get Portkey config for Gemini 2.5 Flash
-        portkey_config = os.getenv("PORTKEY_GEMINI25FLASH_CONFIG")
-        
-        # Since Portkey presents an OpenAI-compatible API, use ChatOpenAI instead
-        from langchain_openai import ChatOpenAI
-        
-        # Create a custom ChatOpenAI class that truncates tool call IDs to 40 characters
-        class GeminiChatOpenAI(ChatOpenAI):
-            def _create_message_dicts(self, messages, stop=None):
-                message_dicts = super()._create_message_dicts(messages, stop=stop)
-                
-                # Truncate tool call IDs if they exist
-                for message in message_dicts:
-                    if message.get("role") == "assistant" and message.get("tool_calls"):
-                        for tool_call in message["tool_calls"]:
-                            if len(tool_call.get("id", "")) > 40:
-                                tool_call["id"] = tool_call["id"][:40]
-                                print(f"Truncated tool call ID to: {tool_call['id']}")
-                
-                return message_dicts
+        portkey_config = _hedge_setting(
+            "LLM_HEDGE_PORTKEY_CONFIG", os.getenv("PORTKEY_GEMINI25FLASH_CONFIG"), backup
+        )
         
+        # Since Portkey presents an OpenAI-compatible API, GeminiChatOpenAI is a ChatOpenAI
         print(f"Using Portkey for Gemini 2.5 Flash with config: {portkey_config}")
         
         # Create Portkey headers
@@ -87,8 +189,11 @@ def get_model(state: AgentState) -> BaseChatModel:
         
         return GeminiChatOpenAI(
             temperature=0,
-            model="gemini-2.5-flash",  # The model name will be mapped by Portkey
+            # The model name will be mapped by Portkey
+            model=_hedge_setting("LLM_HEDGE_MODEL", "gemini-2.5-flash", backup),
             api_key=portkey_api_key,
             base_url=PORTKEY_GATEWAY_URL,
-            default_headers=portkey_headers
+            default_headers=portkey_headers,
+            # Report token usage, including cached input tokens, when streaming
+            stream_usage=True
         )
@@ -2,16 +2,20 @@
 The search node is responsible for searching the internet for information.
 """
 
-import os
-from typing import cast, List
+import re
+import json
+from typing import cast, List, Set
 from pydantic import BaseModel, Field
-from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import AIMessage, ToolMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig, Runnable
+from langchain_core.messages import AIMessage, ToolMessage, SystemMessage, BaseMessage
 from langchain.tools import tool
-from tavily import TavilyClient
 from copilotkit.langgraph import copilotkit_emit_state, copilotkit_customize_config
 from research_canvas.langgraph.state import AgentState
-from research_canvas.langgraph.model import get_model
+from research_canvas.langgraph.model import get_model, bind_tools
+from research_canvas.resource_service import prefetch_resource
+from research_canvas.search_service import search_as_completed
+from research_canvas.search_payload import compact_search_results
+from research_canvas.ranking import choose_resources
 
 class ResourceInput(BaseModel):
     """A resource with a short description"""
@@ -23,7 +27,31 @@ class ResourceInput(BaseModel):
 def ExtractResources(resources: List[ResourceInput]): # pylint: disable=invalid-name,unused-argument
     """Extract the 3-5 most relevant resources from a search result."""
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+# A "url" property whose string value has been closed in the streamed arguments
+_STREAMED_URL = re.compile(r'"url"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+async def _extract_resources_with_prefetch(
+    runnable: Runnable,
+    messages: List[BaseMessage],
+    config: RunnableConfig
+) -> AIMessage:
+    """
+    Stream the ExtractResources call, handing each resource URL to the downloader
+    as soon as it is complete in the streamed tool arguments.
+    """
+    response = None
+    arguments = ""
+    prefetched: Set[str] = set()
+    async for chunk in runnable.astream(messages, config):
+        response = chunk if response is None else response + chunk
+        for tool_call_chunk in chunk.tool_call_chunks:
+            arguments += tool_call_chunk.get("args") or ""
+        for match in _STREAMED_URL.finditer(arguments):
+            url = json.loads(f'"{match.group(1)}"')
+            if url not in prefetched:
+                prefetched.add(url)
+                prefetch_resource(url)
+    return cast(AIMessage, response)
 
 async def search_node(state: AgentState, config: RunnableConfig):
     """
@@ -36,6 +64,8 @@ async def search_node(state: AgentState, config: RunnableConfig):
     state["logs"] = state.get("logs", [])
     queries = ai_message.tool_calls[0]["args"]["queries"]
 
+    logs_offset = len(state["logs"])
+
     for query in queries:
         state["logs"].append({
             "message": f"Search for {query}",
@@ -44,51 +74,71 @@ async def search_node(state: AgentState, config: RunnableConfig):
 
     await copilotkit_emit_state(config, state)
 
-    search_results = []
+    search_results = [None] * len(queries)
 
-    for i, query in enumerate(queries):
-        response = tavily_client.search(query)
-        search_results.append(response)
-        state["logs"][i]["done"] = True
+    # Run the searches concurrently, marking each one done as it returns
+    known_urls = [resource["url"] for resource in state.get("resources", [])]
+    async for i, response in search_as_completed(queries, known_urls):
+        search_results[i] = response
+        state["logs"][logs_offset + i]["done"] = True
         await copilotkit_emit_state(config, state)
 
-    config = copilotkit_customize_config(
-        config,
-        emit_intermediate_state=[{
-            "state_key": "resources",
-            "tool": "ExtractResources",
-            "tool_argument": "resources",
-        }],
+    resources = choose_resources(
+        "langgraph",
+        search_results,
+        queries,
+        state.get("research_question", ""),
+        (resource["url"] for resource in state["resources"])
     )
+    if resources is not None:
+        for resource in resources:
+            prefetch_resource(resource["url"])
+        state["logs"] = []
+        await copilotkit_emit_state(config, state)
+    else:
+        config = copilotkit_customize_config(
+            config,
+            emit_intermediate_state=[{
+                "state_key": "resources",
+                "tool": "ExtractResources",
+                "tool_argument": "resources",
+            }],
+        )
+
+        model = get_model(state)
+        ainvoke_kwargs = {}
+        if model.__class__.__name__ in ["ChatOpenAI"]:
+            ainvoke_kwargs["parallel_tool_calls"] = False
+
+        # figure out which resources to use
+        extract_resources = bind_tools(
+            model,
+            [ExtractResources],
+            tool_choice="ExtractResources",
+            **ainvoke_kwargs
+        )
+        messages = [
+            SystemMessage(
+                content="""
+                You need to extract the 3-5 most relevant resources from the following search results.
+                """
+            ),
+            *state["messages"],
+            ToolMessage(
+            tool_call_id=ai_message.tool_calls[0]["id"],
+            content=(
+                "Performed search:\n"
+                f"{compact_search_results(search_results, state['resources'])}"
+            )
+        )
+        ]
+        response = await _extract_resources_with_prefetch(extract_resources, messages, config)
+
+        state["logs"] = []
+        await copilotkit_emit_state(config, state)
 
-    model = get_model(state)
-    ainvoke_kwargs = {}
-    if model.__class__.__name__ in ["ChatOpenAI"]:
-        ainvoke_kwargs["parallel_tool_calls"] = False
-
-    # figure out which resources to use
-    response = await model.bind_tools(
-        [ExtractResources],
-        tool_choice="ExtractResources",
-        **ainvoke_kwargs
-    ).ainvoke([
-        SystemMessage(
-            content="""
-            You need to extract the 3-5 most relevant resources from the following search results.
-            """
-        ),
-        *state["messages"],
-        ToolMessage(
-        tool_call_id=ai_message.tool_calls[0]["id"],
-        content=f"Performed search: {search_results}"
-    )
-    ], config)
-
-    state["logs"] = []
-    await copilotkit_emit_state(config, state)
-
-    ai_message_response = cast(AIMessage, response)
-    resources = ai_message_response.tool_calls[0]["args"]["resources"]
+        ai_message_response = cast(AIMessage, response)
+        resources = ai_message_response.tool_calls[0]["args"]["resources"]
 
     state["resources"].extend(resources)
 
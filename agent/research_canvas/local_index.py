@@ -0,0 +1,368 @@
+"""
+Local full-text index of every resource we have downloaded.
+
+When LOCAL_INDEX_DIR is set, each converted resource is added to a BM25
+inverted index kept on disk in that directory, and searches are answered from
+it before Tavily is asked. The index is made of immutable segments: every
+added resource writes a small segment. Segments fall into tiers by size, each
+LOCAL_INDEX_MERGE_FACTOR times larger than the one below, and once a tier holds
+LOCAL_INDEX_MERGE_FACTOR adjacent segments they are merged into one segment of
+the next tier, so every posting is rewritten only a logarithmic number of
+times. Postings are read through mmap, so only the term dictionaries and
+document lengths live in memory.
+
+Layout of the index directory:
+    manifest.json   segments in use and documents deleted since the last merge
+    docs.jsonl      one line per indexed document: url, title, length, snippet
+    <n>.terms       JSON map of term -> [offset, document frequency] of a segment
+    <n>.post        postings of a segment as pairs of uint32 (document id, term frequency)
+"""
+import os
+import re
+import json
+import math
+import mmap
+import hashlib
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "")
+_MERGE_FACTOR = int(os.getenv("LOCAL_INDEX_MERGE_FACTOR", "10"))
+# Length of the document start kept to show as a search result snippet
+_SNIPPET_CHARS = int(os.getenv("LOCAL_INDEX_SNIPPET_CHARS", "500"))
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the "
+    "this to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase index terms, leaving out stopwords and single characters.
+    """
+    return [
+        word for word in _WORD.findall(text.lower())
+        if len(word) > 1 and word not in _STOPWORDS
+    ]
+
+
+class LocalHit(NamedTuple):
+    """
+    A document matching a local search.
+    """
+    url: str
+    title: str
+    snippet: str
+    score: float
+    # Share of the distinct query terms found in the document
+    coverage: float
+
+
+class _Segment:
+    """
+    An immutable, memory-mapped part of the index.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        with open(os.path.join(directory, f"{name}.terms"), encoding="utf-8") as f:
+            self.terms: Dict[str, List[int]] = json.load(f)
+        self._file = open(os.path.join(directory, f"{name}.post"), "rb") # pylint: disable=consider-using-with
+        size = os.fstat(self._file.fileno()).st_size
+        # Number of postings
+        self.size = size // 8
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def postings(self, term: str) -> Iterable[Tuple[int, int]]:
+        entry = self.terms.get(term)
+        if entry is None or self._map is None:
+            return ()
+        offset, count = entry
+        values = array("I")
+        values.frombytes(self._map[offset * 8:(offset + count) * 8])
+        return zip(values[0::2], values[1::2])
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def _write_segment(directory: str, name: str, postings: Dict[str, List[Tuple[int, int]]]):
+    terms: Dict[str, List[int]] = {}
+    values = array("I")
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(values) // 2, len(entries)]
+        for doc_id, frequency in entries:
+            values.append(doc_id)
+            values.append(frequency)
+    post_path = os.path.join(directory, f"{name}.post")
+    with open(post_path + ".tmp", "wb") as f:
+        values.tofile(f)
+    os.replace(post_path + ".tmp", post_path)
+    terms_path = os.path.join(directory, f"{name}.terms")
+    with open(terms_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(terms, f, separators=(",", ":"))
+    os.replace(terms_path + ".tmp", terms_path)
+
+
+class LocalIndex:
+    """
+    An on-disk BM25 index of converted resources that grows one document at a time.
+    """
+
+    def __init__(self, directory: str, merge_factor: int = _MERGE_FACTOR):
+        self.directory = directory
+        self.merge_factor = max(2, merge_factor)
+        self.searches = 0
+        self.merges = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._segments: List[_Segment] = []
+        self._deleted: set = set()
+        self._next_segment = 0
+        # Per document id: byte offset in docs.jsonl and length in terms
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        # Live document of each URL, with the hash of the content it was indexed from
+        self._documents: Dict[str, Tuple[int, str]] = {}
+        self._total_length = 0
+        self._docs_file = None
+        self._docs_map: Optional[mmap.mmap] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {"segments": [], "deleted": [], "next_segment": 0}
+        if os.path.exists(self._path("manifest.json")):
+            with open(self._path("manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+        self._segments = [_Segment(self.directory, name) for name in manifest["segments"]]
+        self._deleted = set(manifest["deleted"])
+        self._next_segment = manifest["next_segment"]
+
+        if os.path.exists(self._path("docs.jsonl")):
+            with open(self._path("docs.jsonl"), "rb") as f:
+                offset = 0
+                for line in f:
+                    document = json.loads(line)
+                    doc_id = len(self._offsets)
+                    self._offsets.append(offset)
+                    self._lengths.append(document["length"])
+                    self._replace_document(document["url"], doc_id, document["hash"])
+                    offset += len(line)
+        self._docs_file = open(self._path("docs.jsonl"), "ab+") # pylint: disable=consider-using-with
+        self._loaded = True
+
+    def _replace_document(self, url: str, doc_id: int, content_hash: str):
+        previous = self._documents.get(url)
+        if previous is not None:
+            self._deleted.add(previous[0])
+            self._total_length -= self._lengths[previous[0]]
+        self._documents[url] = (doc_id, content_hash)
+        self._total_length += self._lengths[doc_id]
+
+    def _write_manifest(self):
+        manifest = {
+            "segments": [segment.name for segment in self._segments],
+            "deleted": sorted(self._deleted),
+            "next_segment": self._next_segment,
+        }
+        with open(self._path("manifest.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(self._path("manifest.json.tmp"), self._path("manifest.json"))
+
+    def add(self, url: str, content: str, title: str = "") -> bool:
+        """
+        Index a document, replacing an earlier version of the same URL.
+        Returns False if this exact content is already indexed.
+        """
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        terms = Counter(tokenize(f"{title}\n{content}"))
+        with self._lock:
+            self._load()
+            previous = self._documents.get(url)
+            if previous is not None and previous[1] == content_hash:
+                return False
+
+            doc_id = len(self._offsets)
+            line = json.dumps({
+                "url": url,
+                "title": title,
+                "hash": content_hash,
+                "length": sum(terms.values()),
+                "snippet": " ".join(content[:_SNIPPET_CHARS * 2].split())[:_SNIPPET_CHARS],
+            }).encode("utf-8") + b"\n"
+            self._docs_file.seek(0, os.SEEK_END)
+            offset = self._docs_file.tell()
+            self._docs_file.write(line)
+            self._docs_file.flush()
+            if self._docs_map is not None:
+                # Remapped on the next read to include the new line
+                self._docs_map.close()
+                self._docs_map = None
+
+            name = str(self._next_segment)
+            self._next_segment += 1
+            _write_segment(
+                self.directory, name,
+                {term: [(doc_id, frequency)] for term, frequency in terms.items()}
+            )
+            self._segments.append(_Segment(self.directory, name))
+            self._offsets.append(offset)
+            self._lengths.append(sum(terms.values()))
+            self._replace_document(url, doc_id, content_hash)
+            while self._merge_tier():
+                pass
+            self._write_manifest()
+        return True
+
+    def _tier(self, segment: _Segment) -> int:
+        return int(math.log(max(1, segment.size), self.merge_factor))
+
+    def _merge_tier(self) -> bool:
+        """
+        Merge the first run of adjacent segments that holds merge_factor
+        segments of one tier and no larger ones, trying the smallest tier
+        first. Returns False if there is none.
+        """
+        tiers = [self._tier(segment) for segment in self._segments]
+        for tier in sorted(set(tiers)):
+            run_start = 0
+            count = 0
+            for i, segment_tier in enumerate(tiers):
+                if segment_tier > tier:
+                    run_start = i + 1
+                    count = 0
+                    continue
+                if segment_tier == tier:
+                    count += 1
+                if count == self.merge_factor:
+                    self._merge(run_start, i + 1)
+                    return True
+        return False
+
+    def _merge(self, start: int, end: int):
+        """
+        Merge the segments from start to end into one, dropping the postings of
+        deleted documents.
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        purged = set()
+        for segment in self._segments[start:end]:
+            for term in segment.terms:
+                live = []
+                for posting in segment.postings(term):
+                    if posting[0] in self._deleted:
+                        purged.add(posting[0])
+                    else:
+                        live.append(posting)
+                if live:
+                    postings.setdefault(term, []).extend(live)
+        for entries in postings.values():
+            entries.sort()
+
+        name = str(self._next_segment)
+        self._next_segment += 1
+        _write_segment(self.directory, name, postings)
+        old_segments = self._segments[start:end]
+        self._segments[start:end] = [_Segment(self.directory, name)]
+        # Every document is in one segment only, so these are gone for good
+        self._deleted -= purged
+        self._write_manifest()
+        for segment in old_segments:
+            segment.close()
+            for extension in ("terms", "post"):
+                os.remove(self._path(f"{segment.name}.{extension}"))
+        self.merges += 1
+
+    def _document(self, doc_id: int) -> Dict[str, Any]:
+        if self._docs_map is None:
+            self._docs_map = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self._offsets[doc_id]
+        end = self._docs_map.find(b"\n", start)
+        return json.loads(self._docs_map[start:end])
+
+    def search(self, query: str, limit: int = 10) -> List[LocalHit]:
+        """
+        Get the best matching documents for a query by BM25.
+        """
+        query_terms = set(tokenize(query))
+        with self._lock:
+            self._load()
+            self.searches += 1
+            documents = len(self._documents)
+            if not documents or not query_terms:
+                return []
+            average_length = self._total_length / documents
+
+            scores: Dict[int, float] = {}
+            matched: Counter = Counter()
+            for term in query_terms:
+                postings = [
+                    posting
+                    for segment in self._segments
+                    for posting in segment.postings(term)
+                    if posting[0] not in self._deleted
+                ]
+                if not postings:
+                    continue
+                idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings:
+                    norm = _BM25_K1 * (
+                        1 - _BM25_B + _BM25_B * self._lengths[doc_id] / average_length
+                    )
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                        frequency * (_BM25_K1 + 1) / (frequency + norm)
+                    )
+                    matched[doc_id] += 1
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            hits = []
+            for doc_id, score in best:
+                document = self._document(doc_id)
+                hits.append(LocalHit(
+                    url=document["url"],
+                    title=document["title"],
+                    snippet=document["snippet"],
+                    score=score,
+                    coverage=matched[doc_id] / len(query_terms)
+                ))
+            return hits
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size of the index. The counters are read without waiting for
+        an add or merge in progress, and are empty until the index is first used.
+        """
+        return {
+            "directory": self.directory,
+            "loaded": self._loaded,
+            "documents": len(self._documents),
+            "segments": len(self._segments),
+            "deleted": len(self._deleted),
+            "searches": self.searches,
+            "merges": self.merges,
+        }
+
+
+_LOCAL_INDEX: Optional[LocalIndex] = LocalIndex(_INDEX_DIR) if _INDEX_DIR else None
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """
+    Get the local index, or None if it is not configured.
+    """
+    return _LOCAL_INDEX
@@ -0,0 +1,70 @@
+"""
+Objects kept per event loop.
+
+aiohttp sessions, futures, timers and model HTTP clients only work on the
+event loop they were created on, so they are kept per loop. A registry drops
+the entries of loops that have been closed whenever it is used; otherwise
+every loop a process ever ran, and everything it owned, would stay alive.
+The values often refer to their loop themselves, so weak keys would not let
+either go.
+"""
+import asyncio
+import threading
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """
+    Get the running event loop, or None outside of one.
+    """
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class LoopRegistry(Generic[T]):
+    """
+    One value per event loop, forgotten once its loop is closed.
+    """
+
+    def __init__(self):
+        self._values: Dict[Optional[asyncio.AbstractEventLoop], T] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        closed = [loop for loop in self._values if loop is not None and loop.is_closed()]
+        for loop in closed:
+            del self._values[loop]
+
+    def get(self, create: Callable[[], T], valid: Callable[[T], bool] = lambda _: True) -> T:
+        """
+        Get the value of the running loop, creating it if there is none or it
+        is no longer valid.
+        """
+        loop = current_loop()
+        with self._lock:
+            self._prune()
+            value = self._values.get(loop)
+            if value is None or not valid(value):
+                value = self._values[loop] = create()
+            return value
+
+    def pop(self) -> Optional[T]:
+        """
+        Remove and return the value of the running loop.
+        """
+        loop = current_loop()
+        with self._lock:
+            self._prune()
+            return self._values.pop(loop, None)
+
+    def values(self) -> List[T]:
+        """
+        Get the values of all loops that are still open.
+        """
+        with self._lock:
+            self._prune()
+            return list(self._values.values())
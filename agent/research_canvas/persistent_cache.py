@@ -0,0 +1,250 @@
+"""
+Optional on-disk tiers for converted resources and search results.
+
+When RESOURCE_CACHE_DB points to a SQLite file (e.g. on a mounted Fly volume),
+converted markdown is kept there together with the ETag / Last-Modified
+validators of the response it came from, so resources survive machine restarts.
+
+Entries younger than RESOURCE_CACHE_DB_FRESH_TTL are served as they are.
+Older entries are still served immediately (stale-while-revalidate) while a
+conditional GET refreshes them in the background, until they are older than
+RESOURCE_CACHE_DB_STALE_TTL, at which point they are fetched again.
+
+When SEARCH_CACHE_DB is set, Tavily responses are kept there as well, keyed
+by their normalised query.
+"""
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, NamedTuple, Optional, Set
+import aiosqlite
+
+_DB_PATH = os.getenv("RESOURCE_CACHE_DB", "")
+_FRESH_TTL = float(os.getenv("RESOURCE_CACHE_DB_FRESH_TTL", str(60 * 60)))
+_STALE_TTL = float(os.getenv("RESOURCE_CACHE_DB_STALE_TTL", str(7 * 24 * 60 * 60)))
+_SEARCH_DB_PATH = os.getenv("SEARCH_CACHE_DB", "")
+
+_RESOURCES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    url TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+)
+"""
+
+_SEARCHES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class StoredResource(NamedTuple):
+    """
+    A converted resource read back from disk.
+    """
+    url: str
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        Whether the resource should be revalidated.
+        """
+        return time.time() - self.fetched_at > _FRESH_TTL
+
+
+class _SqliteCache:
+    """
+    A lazily opened SQLite database with one table.
+    """
+
+    schema = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        async with self._connect_lock:
+            if self._db is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = await aiosqlite.connect(self.path)
+                await self._db.execute("PRAGMA journal_mode=WAL")
+                await self._db.execute(self.schema)
+                await self._db.commit()
+            return self._db
+
+
+class PersistentResourceCache(_SqliteCache):
+    """
+    SQLite-backed store of converted resources and their HTTP validators.
+    """
+
+    schema = _RESOURCES_SCHEMA
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.revalidations = 0
+        self._revalidating: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get(self, url: str) -> Optional[StoredResource]:
+        """
+        Get a stored resource, or None if it is missing or too old to serve.
+        """
+        db = await self._connection()
+        async with db.execute(
+            "SELECT url, content, etag, last_modified, fetched_at FROM resources WHERE url = ?",
+            (url,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or time.time() - row[4] > _STALE_TTL:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return StoredResource(*row)
+
+    async def put(
+        self,
+        url: str,
+        content: str,
+        etag: Optional[str],
+        last_modified: Optional[str]
+    ):
+        """
+        Store a converted resource.
+        """
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO resources "
+            "(url, content, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (url, content, etag, last_modified, time.time())
+        )
+        await db.commit()
+
+    async def touch(self, url: str):
+        """
+        Mark a stored resource as fresh after the server confirmed it is unchanged.
+        """
+        db = await self._connection()
+        await db.execute(
+            "UPDATE resources SET fetched_at = ? WHERE url = ?",
+            (time.time(), url)
+        )
+        await db.commit()
+
+    def revalidate_in_background(
+        self,
+        stored: StoredResource,
+        revalidate: Callable[[StoredResource], Awaitable[None]]
+    ):
+        """
+        Schedule a revalidation of a stale resource, at most one per URL at a time.
+        """
+        if stored.url in self._revalidating:
+            return
+        self._revalidating.add(stored.url)
+        self.revalidations += 1
+
+        async def run():
+            try:
+                await revalidate(stored)
+            except Exception as e: # pylint: disable=broad-except
+                print(f"Error revalidating {stored.url}: {e}")
+            finally:
+                self._revalidating.discard(stored.url)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self):
+        """
+        Get the cache counters.
+        """
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+        }
+
+
+class PersistentSearchCache(_SqliteCache):
+    """
+    SQLite-backed store of search responses keyed by normalised query.
+    """
+
+    schema = _SEARCHES_SCHEMA
+
+    async def get(self, query: str, max_age: float) -> Optional[str]:
+        """
+        Get a stored response as JSON, or None if it is missing or older than max_age.
+        """
+        db = await self._connection()
+        async with db.execute(
+            "SELECT response, fetched_at FROM searches WHERE query = ?",
+            (query,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    async def put(self, query: str, response: str):
+        """
+        Store a response serialised as JSON.
+        """
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO searches (query, response, fetched_at) VALUES (?, ?, ?)",
+            (query, response, time.time())
+        )
+        await db.commit()
+
+    def stats(self):
+        """
+        Get the cache counters.
+        """
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_PERSISTENT_CACHE: Optional[PersistentResourceCache] = (
+    PersistentResourceCache(_DB_PATH) if _DB_PATH else None
+)
+_PERSISTENT_SEARCH_CACHE: Optional[PersistentSearchCache] = (
+    PersistentSearchCache(_SEARCH_DB_PATH) if _SEARCH_DB_PATH else None
+)
+
+
+def get_persistent_cache() -> Optional[PersistentResourceCache]:
+    """
+    Get the on-disk resource cache, or None if it is not configured.
+    """
+    return _PERSISTENT_CACHE
+
+
+def get_persistent_search_cache() -> Optional[PersistentSearchCache]:
+    """
+    Get the on-disk search cache, or None if it is not configured.
+    """
+    return _PERSISTENT_SEARCH_CACHE
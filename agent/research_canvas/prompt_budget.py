@@ -0,0 +1,251 @@
+"""
+Token budgeting for the chat prompts.
+
+The system prompt carries the instructions, the research question, the report
+and the resources, and is followed by the message history. Before each call
+these parts are measured and fitted into PROMPT_TOKEN_BUDGET tokens, giving
+up the lowest-priority material first:
+
+    1. instructions, research question and report   always kept
+    2. latest messages                               the last PROMPT_MIN_MESSAGES are always kept
+    3. resource content                              shares what is left, evenly per resource
+    4. older messages                                dropped oldest first
+
+The report is the document the model rewrites through WriteReport, so it is
+never cut by default: a cut copy would be written back and lose everything
+past the cut. PROMPT_REPORT_SHARE caps it at a share of the budget for
+callers that do not let the model rewrite the report.
+
+Tokens are counted with tiktoken when it is installed, with a character
+estimate otherwise, and counts of repeated texts are cached. The tiktoken
+encoding is loaded in the background at import, since it may have to be
+downloaded; counts are estimated until it is ready.
+"""
+import logging
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from research_canvas.search_payload import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError: # pragma: no cover - optional dependency
+    tiktoken = None
+
+_logger = logging.getLogger(__name__)
+
+_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "24000"))
+# 0 never cuts the report
+_REPORT_SHARE = float(os.getenv("PROMPT_REPORT_SHARE", "0"))
+_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.3"))
+_MIN_MESSAGES = int(os.getenv("PROMPT_MIN_MESSAGES", "2"))
+_TOKENIZER_ENCODING = os.getenv("PROMPT_TOKENIZER_ENCODING", "o200k_base")
+# Counts of texts up to this length are cached by the text itself, longer ones
+# by their hash, so the cache never holds whole documents
+_CACHED_TEXT_CHARS = 4096
+_CACHED_COUNTS = 4096
+
+_TRUNCATED = "\n[...truncated]"
+
+
+_ENCODING = None
+
+
+def _encoding():
+    return _ENCODING
+
+
+def _count(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+_count_short = lru_cache(maxsize=_CACHED_COUNTS)(_count)
+# (SHA-256, length) of a long text -> token count
+_LONG_COUNTS: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+_LONG_COUNTS_LOCK = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text.
+    """
+    if len(text) <= _CACHED_TEXT_CHARS:
+        return _count_short(text)
+    key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), len(text))
+    with _LONG_COUNTS_LOCK:
+        tokens = _LONG_COUNTS.get(key)
+        if tokens is not None:
+            _LONG_COUNTS.move_to_end(key)
+            return tokens
+    tokens = _count(text)
+    with _LONG_COUNTS_LOCK:
+        _LONG_COUNTS[key] = tokens
+        while len(_LONG_COUNTS) > _CACHED_COUNTS:
+            _LONG_COUNTS.popitem(last=False)
+    return tokens
+
+
+def _load_encoding():
+    global _ENCODING # pylint: disable=global-statement
+    try:
+        encoding = tiktoken.get_encoding(_TOKENIZER_ENCODING)
+    except Exception as e: # pylint: disable=broad-except
+        print(f"Tokenizer unavailable, estimating tokens: {e}")
+        return
+    _ENCODING = encoding
+    # Forget the estimates made while the encoding was loading
+    _count_short.cache_clear()
+    with _LONG_COUNTS_LOCK:
+        _LONG_COUNTS.clear()
+
+
+if tiktoken is not None:
+    threading.Thread(target=_load_encoding, name="tokenizer", daemon=True).start()
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """
+    Cut a text to at most limit tokens, marking that it was cut.
+    """
+    if count_tokens(text) <= limit:
+        return text
+    if limit <= count_tokens(_TRUNCATED):
+        return ""
+    limit -= count_tokens(_TRUNCATED)
+    encoding = _encoding()
+    if encoding is None:
+        return text[:limit * 4] + _TRUNCATED
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:limit]) + _TRUNCATED
+
+
+def _message_fields(message: Any) -> Dict[str, Any]:
+    if isinstance(message, dict):
+        return message
+    return {
+        "role": getattr(message, "type", ""),
+        "content": getattr(message, "content", ""),
+        "tool_calls": getattr(message, "tool_calls", None),
+    }
+
+
+def message_tokens(message: Any) -> int:
+    """
+    Count the tokens of a chat message, LangChain or OpenAI style, including its tool calls.
+    """
+    fields = _message_fields(message)
+    content = fields.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    tokens = count_tokens(content) + 4
+    if fields.get("tool_calls"):
+        tokens += count_tokens(json.dumps(fields["tool_calls"], default=str))
+    return tokens
+
+
+def _is_tool_result(message: Any) -> bool:
+    return _message_fields(message).get("role") == "tool"
+
+
+def format_resources(resources: List[Dict[str, Any]]) -> str:
+    """
+    Render resources compactly for the system prompt.
+    """
+    if not resources:
+        return "(none)"
+    blocks = []
+    for i, resource in enumerate(resources, 1):
+        lines = [f"[{i}] {resource.get('title') or 'Untitled'}", resource.get("url", "")]
+        if resource.get("description"):
+            lines.append(resource["description"])
+        if resource.get("content"):
+            lines.append(resource["content"])
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+class FittedPrompt(NamedTuple):
+    """
+    The parts of a prompt after they were fitted into the budget.
+    """
+    report: str
+    resources: List[Dict[str, Any]]
+    messages: List[Any]
+    breakdown: Dict[str, int]
+
+
+def fit_prompt(
+    instructions: str,
+    research_question: str,
+    report: str,
+    resources: List[Dict[str, Any]],
+    messages: List[Any],
+    budget: Optional[int] = None
+) -> FittedPrompt:
+    """
+    Fit the report, resources and message history into the token budget.
+    instructions is the system prompt without any of the variable parts.
+    """
+    budget = budget or _TOKEN_BUDGET
+    breakdown = {
+        "instructions": count_tokens(instructions),
+        "research_question": count_tokens(research_question),
+    }
+    remaining = budget - breakdown["instructions"] - breakdown["research_question"]
+
+    if _REPORT_SHARE > 0:
+        report = truncate_tokens(report, max(0, int(budget * _REPORT_SHARE)))
+    breakdown["report"] = count_tokens(report)
+    remaining -= breakdown["report"]
+
+    # The latest messages are kept whatever they cost, older ones only while
+    # they fit into the history share
+    history_budget = max(0, int(remaining * _HISTORY_SHARE))
+    kept = 0
+    history_tokens = 0
+    for message in reversed(messages):
+        tokens = message_tokens(message)
+        if kept >= _MIN_MESSAGES and history_tokens + tokens > history_budget:
+            break
+        kept += 1
+        history_tokens += tokens
+    start = len(messages) - kept
+    # A tool result cannot lead the history without the call it answers
+    while start < len(messages) - 1 and _is_tool_result(messages[start]):
+        history_tokens -= message_tokens(messages[start])
+        start += 1
+    fitted_messages = list(messages[start:])
+    breakdown["history"] = history_tokens
+    remaining -= history_tokens
+
+    # Resources without content cost their header; content shares the rest evenly
+    headers = [{**resource, "content": ""} for resource in resources]
+    remaining -= count_tokens(format_resources(headers))
+    fitted_resources = []
+    pending = sorted(
+        range(len(resources)),
+        key=lambda i: count_tokens(resources[i].get("content") or "")
+    )
+    fitted_contents: Dict[int, str] = {}
+    for position, i in enumerate(pending):
+        share = max(0, remaining) // (len(pending) - position)
+        content = truncate_tokens(resources[i].get("content") or "", share)
+        fitted_contents[i] = content
+        remaining -= count_tokens(content)
+    for i, resource in enumerate(resources):
+        fitted_resources.append({**resource, "content": fitted_contents.get(i, "")})
+    breakdown["resources"] = count_tokens(format_resources(fitted_resources))
+    breakdown["total"] = sum(breakdown.values())
+
+    dropped = len(messages) - len(fitted_messages)
+    _logger.debug(
+        "Prompt tokens: " + ", ".join(f"{key}={value}" for key, value in breakdown.items())
+        + (f" (dropped {dropped} old messages)" if dropped else "")
+    )
+    return FittedPrompt(report, fitted_resources, fitted_messages, breakdown)
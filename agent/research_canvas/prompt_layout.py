@@ -0,0 +1,167 @@
+"""
+Chat prompt layout that keeps provider-side prompt caches warm.
+
+Providers cache the longest prompt prefix they have seen before, so content
+is ordered from most to least stable: the fixed instructions first, then the
+research question, the resources and, last, the report, which changes on
+every WriteReport.
+
+PROMPT_LAYOUT selects where the volatile context goes:
+    split   the instructions as the first system message, the message history,
+            then the context as a trailing system message, so the cached prefix
+            grows with the conversation (default)
+    inline  one system message: instructions followed by the context. The
+            report and the selected resources change from turn to turn, so
+            only the instructions stay cacheable, and they are shorter than
+            the 1024 tokens OpenAI needs to cache a prefix at all
+
+With PROMPT_CACHE_BREAKPOINTS on (for providers such as Anthropic behind
+Portkey), the instructions and the latest message carry cache_control
+breakpoints. Cached input tokens reported by the provider are counted either way.
+"""
+import logging
+import os
+import asyncio
+from typing import Any, Dict, Iterator, List
+from research_canvas.prompt_budget import format_resources
+
+_logger = logging.getLogger(__name__)
+
+_PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "split")
+_CACHE_BREAKPOINTS = os.getenv("PROMPT_CACHE_BREAKPOINTS", "false").lower() == "true"
+
+_STATS = {
+    "calls": 0,
+    "input_tokens": 0,
+    "cached_tokens": 0,
+}
+
+
+def format_context(research_question: str, report: str, resources: List[Dict[str, Any]]) -> str:
+    """
+    Render the variable part of the system prompt, most stable first.
+    """
+    return (
+        f"This is the research question:\n{research_question}\n\n"
+        f"Here are the resources that you have available:\n{format_resources(resources)}\n\n"
+        f"This is the research report:\n{report}\n"
+    )
+
+
+def _system_message(text: str, breakpoint: bool = False) -> Dict[str, Any]:
+    if breakpoint and _CACHE_BREAKPOINTS:
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}],
+        }
+    return {"role": "system", "content": text}
+
+
+def _with_breakpoint(messages: List[Any]) -> List[Any]:
+    """
+    Mark the latest message with text content as a cache breakpoint.
+    """
+    if not _CACHE_BREAKPOINTS:
+        return messages
+    messages = list(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        content = message.get("content") if isinstance(message, dict) else message.content
+        if not isinstance(content, str) or not content:
+            continue
+        blocks = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+        if isinstance(message, dict):
+            messages[i] = {**message, "content": blocks}
+        else:
+            messages[i] = message.model_copy(update={"content": blocks})
+        break
+    return messages
+
+
+def build_chat_messages(
+    instructions: str,
+    research_question: str,
+    report: str,
+    resources: List[Dict[str, Any]],
+    history: List[Any]
+) -> List[Any]:
+    """
+    Assemble the system prompt and message history for a chat call.
+    System messages are OpenAI-style dicts; history messages are passed through.
+    """
+    context = format_context(research_question, report, resources)
+    if _PROMPT_LAYOUT == "split":
+        return [
+            _system_message(instructions, breakpoint=True),
+            *_with_breakpoint(history),
+            _system_message(context),
+        ]
+    return [
+        _system_message(f"{instructions}\n{context}", breakpoint=True),
+        *_with_breakpoint(history),
+    ]
+
+
+def _field(value: Any, name: str) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def record_prompt_usage(response: Any):
+    """
+    Count the input and cached tokens a response reports, from either a
+    LangChain message or a LiteLLM response.
+    """
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        input_tokens = usage_metadata.get("input_tokens") or 0
+        cached_tokens = (usage_metadata.get("input_token_details") or {}).get("cache_read") or 0
+    else:
+        usage = _field(response, "usage")
+        if usage is None:
+            return
+        input_tokens = _field(usage, "prompt_tokens") or 0
+        cached_tokens = _field(_field(usage, "prompt_tokens_details"), "cached_tokens") or 0
+    if not input_tokens:
+        # Nothing was reported
+        return
+
+    _STATS["calls"] += 1
+    _STATS["input_tokens"] += input_tokens
+    _STATS["cached_tokens"] += cached_tokens
+    _logger.debug(f"Prompt cache: {cached_tokens} of {input_tokens} input tokens cached")
+
+
+async def record_stream_usage(stream: Iterator):
+    """
+    Count the tokens reported by a LiteLLM stream that copilotkit_stream has
+    read. It stops at the finish reason, and the usage chunk follows it, so
+    the rest of the stream is read here, off the event loop.
+    """
+    def read_usage():
+        usage = None
+        for chunk in stream:
+            if _field(chunk, "usage") is not None:
+                usage = _field(chunk, "usage")
+        return usage
+
+    usage = await asyncio.to_thread(read_usage)
+    if usage is not None:
+        record_prompt_usage({"usage": usage})
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """
+    Get the share of input tokens served from provider prompt caches.
+    """
+    return {
+        **_STATS,
+        "layout": _PROMPT_LAYOUT,
+        "breakpoints": _CACHE_BREAKPOINTS,
+        "cached_ratio": (
+            _STATS["cached_tokens"] / _STATS["input_tokens"] if _STATS["input_tokens"] else 0.0
+        ),
+    }
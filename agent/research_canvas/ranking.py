@@ -0,0 +1,147 @@
+"""
+Heuristic choice of resources from search results.
+
+Picking 3-5 resources with the ExtractResources tool costs a full model round
+trip per search. The ranker here scores the fused search results instead, by
+rank fusion, the relevance score of the search backend and the lexical
+overlap with the queries and the research question, and prefers resources
+from different domains.
+
+Each agent selects a mode with <AGENT>_RESOURCE_RANKER, falling back to
+RESOURCE_RANKER:
+    llm                 let the model pick the resources (the default)
+    heuristic           always use the ranker
+    heuristic_then_llm  use the ranker, asking the model when its confidence
+                        is below RESOURCE_RANKER_MIN_CONFIDENCE
+"""
+import logging
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlparse
+from research_canvas.local_index import tokenize
+from research_canvas.search_payload import fuse_search_results, truncate_text
+
+_logger = logging.getLogger(__name__)
+
+_DEFAULT_MODE = os.getenv("RESOURCE_RANKER", "llm")
+_MIN_CONFIDENCE = float(os.getenv("RESOURCE_RANKER_MIN_CONFIDENCE", "0.5"))
+_MAX_RESOURCES = int(os.getenv("RESOURCE_RANKER_MAX_RESOURCES", "5"))
+_DESCRIPTION_CHARS = 300
+
+_FUSION_WEIGHT = 0.4
+_RELEVANCE_WEIGHT = 0.3
+_OVERLAP_WEIGHT = 0.3
+# Score multiplier for each resource already chosen from the same domain
+_DOMAIN_PENALTY = 0.6
+
+
+class Ranking(NamedTuple):
+    """
+    Resources chosen by the ranker and how sure it is about them.
+    """
+    resources: List[Dict[str, str]]
+    confidence: float
+
+
+def get_ranker_mode(agent: str) -> str:
+    """
+    Get the ranking mode configured for an agent.
+    """
+    return os.getenv(f"{agent.upper()}_RESOURCE_RANKER", _DEFAULT_MODE).lower()
+
+
+def _overlap(terms: set, texts: List[set]) -> float:
+    """
+    The best share of any text's terms that appear in a result.
+    """
+    return max(
+        (len(text & terms) / len(text) for text in texts if text),
+        default=0.0
+    )
+
+
+def _domain(url: str) -> str:
+    host = urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def rank_resources(
+    search_results: List[Optional[Dict[str, Any]]],
+    queries: List[str],
+    research_question: str = "",
+    exclude_urls: Iterable[str] = (),
+    limit: int = _MAX_RESOURCES
+) -> Ranking:
+    """
+    Choose up to limit resources from the results of several queries.
+    """
+    hits = fuse_search_results(search_results, exclude_urls)
+    if not hits:
+        return Ranking([], 0.0)
+
+    texts = [set(tokenize(text)) for text in [*queries, research_question]]
+    max_fusion = max(hit.score for hit in hits)
+    max_relevance = max(hit.relevance for hit in hits)
+    scored = []
+    for hit in hits:
+        relevance = hit.relevance / max_relevance if max_relevance > 0 else 0.0
+        score = (
+            _FUSION_WEIGHT * hit.score / max_fusion
+            + _RELEVANCE_WEIGHT * relevance
+            + _OVERLAP_WEIGHT * _overlap(set(tokenize(f"{hit.title} {hit.snippet}")), texts)
+        )
+        scored.append((score, hit))
+
+    chosen = []
+    domains: Dict[str, int] = {}
+    while scored and len(chosen) < limit:
+        best = max(
+            range(len(scored)),
+            key=lambda i: scored[i][0] * _DOMAIN_PENALTY ** domains.get(_domain(scored[i][1].url), 0)
+        )
+        score, hit = scored.pop(best)
+        domain = _domain(hit.url)
+        domains[domain] = domains.get(domain, 0) + 1
+        chosen.append((score, hit))
+
+    # Fewer results than asked for means the search found little
+    confidence = (
+        sum(score for score, _ in chosen) / len(chosen)
+        * min(1.0, len(chosen) / min(3, limit))
+    )
+    resources = [
+        {
+            "url": hit.url,
+            "title": hit.title or "Untitled Resource",
+            "description": (
+                truncate_text(hit.snippet, _DESCRIPTION_CHARS) or "No description available."
+            ),
+        }
+        for _, hit in chosen
+    ]
+    return Ranking(resources, confidence)
+
+
+def choose_resources(
+    agent: str,
+    search_results: List[Optional[Dict[str, Any]]],
+    queries: List[str],
+    research_question: str = "",
+    exclude_urls: Iterable[str] = ()
+) -> Optional[List[Dict[str, str]]]:
+    """
+    Choose resources without the model if the agent's ranking mode allows it.
+    Returns None when the model should pick them.
+    """
+    mode = get_ranker_mode(agent)
+    if mode not in ("heuristic", "heuristic_then_llm"):
+        return None
+    ranking = rank_resources(search_results, queries, research_question, exclude_urls)
+    if mode == "heuristic_then_llm" and ranking.confidence < _MIN_CONFIDENCE:
+        _logger.debug(
+            f"Ranker confidence {ranking.confidence:.2f} is below {_MIN_CONFIDENCE}, "
+            "asking the model"
+        )
+        return None
+    _logger.debug(f"Ranked {len(ranking.resources)} resources (confidence {ranking.confidence:.2f})")
+    return ranking.resources
@@ -0,0 +1,215 @@
+"""
+Retries, per-host circuit breakers and failure TTLs for resource fetches.
+"""
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from typing import Any, Dict, NamedTuple, Optional
+import aiohttp
+from research_canvas.http_client import fetch_text, FetchResult
+from research_canvas.scheduler import get_scheduler
+
+# Attempts per fetch, including the first one
+_RETRY_ATTEMPTS = int(os.getenv("RESOURCE_RETRY_ATTEMPTS", "2"))
+_RETRY_BASE_DELAY = float(os.getenv("RESOURCE_RETRY_BASE_DELAY", "0.5"))
+_RETRY_MAX_DELAY = float(os.getenv("RESOURCE_RETRY_MAX_DELAY", "4"))
+# A Retry-After longer than this is not waited for; the fetch fails instead
+_MAX_RETRY_AFTER = float(os.getenv("RESOURCE_MAX_RETRY_AFTER", "30"))
+
+# Consecutive transient failures that open a host's circuit
+_BREAKER_THRESHOLD = int(os.getenv("RESOURCE_BREAKER_THRESHOLD", "3"))
+# Seconds an open circuit rejects fetches before letting a trial request through
+_BREAKER_COOLDOWN = float(os.getenv("RESOURCE_BREAKER_COOLDOWN", "60"))
+
+# Seconds a failed resource is remembered before it is fetched again
+_TRANSIENT_FAILURE_TTL = float(os.getenv("RESOURCE_FAILURE_TTL", "60"))
+_PERMANENT_FAILURE_TTL = float(os.getenv("RESOURCE_PERMANENT_FAILURE_TTL", str(60 * 60)))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a host's circuit is open and the fetch is skipped.
+    """
+
+
+class FailedResource(NamedTuple):
+    """
+    A negative cache entry for a resource that could not be fetched.
+    """
+    error: str
+    transient: bool
+    failed_at: float
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether a fetch error is worth retrying.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        CircuitOpenError,
+    ))
+
+
+def failure_ttl(error: BaseException) -> float:
+    """
+    How long a failed resource should be remembered before trying again.
+    """
+    return _TRANSIENT_FAILURE_TTL if is_transient(error) else _PERMANENT_FAILURE_TTL
+
+
+def failed_resource(error: BaseException) -> FailedResource:
+    """
+    Build the negative cache entry for a fetch error.
+    """
+    return FailedResource(str(error) or type(error).__name__, is_transient(error), time.time())
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of one host and short-circuits fetches while it is down.
+    """
+
+    def __init__(self, threshold: int = _BREAKER_THRESHOLD, cooldown: float = _BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        closed, open or half_open.
+        """
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def check(self, host: str):
+        """
+        Raise if the circuit is open.
+        """
+        if self.state == "open":
+            self.rejected += 1
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+    def record_success(self):
+        """
+        Close the circuit.
+        """
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        """
+        Count a transient failure, opening (or re-opening) the circuit at the threshold.
+        """
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """
+    Get the circuit breaker for a URL's host.
+    """
+    host = urlparse(url).hostname or ""
+    breaker = _BREAKERS.get(host)
+    if breaker is None:
+        breaker = _BREAKERS[host] = CircuitBreaker()
+    return breaker
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Read the Retry-After header of a 429 or 503 response, in seconds.
+    """
+    if not isinstance(error, aiohttp.ClientResponseError) or error.status not in (429, 503):
+        return None
+    value = (error.headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _backoff(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def fetch_with_retries(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> FetchResult:
+    """
+    Fetch a resource, retrying transient errors with backoff unless the host's circuit is open.
+    """
+    host = urlparse(url).hostname or ""
+    breaker = get_breaker(url)
+    scheduler = get_scheduler()
+    attempt = 0
+    while True:
+        breaker.check(host)
+        try:
+            async with scheduler.slot(url):
+                result = await fetch_text(url, etag, last_modified)
+        except Exception as e: # pylint: disable=broad-except
+            if not is_transient(e):
+                # The host answered, it just has nothing useful for us
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None:
+                # The scheduler holds back every fetch to this host, including our retry
+                scheduler.retry_after(url, retry_after)
+            if attempt + 1 >= _RETRY_ATTEMPTS or (retry_after or 0) > _MAX_RETRY_AFTER:
+                raise
+            if retry_after is None:
+                await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+        else:
+            breaker.record_success()
+            return result
+
+
+def get_breaker_stats() -> Dict[str, Any]:
+    """
+    Get the hosts whose circuits are not closed.
+    """
+    return {
+        host: {
+            "state": breaker.state,
+            "failures": breaker.failures,
+            "rejected": breaker.rejected,
+        }
+        for host, breaker in _BREAKERS.items()
+        if breaker.state != "closed"
+    }
@@ -0,0 +1,143 @@
+"""
+Bounded in-memory cache for downloaded resources.
+
+Entries are evicted least-recently-used first once the cache grows beyond its
+byte budget, and optionally expire after a TTL.
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Memory budget for cached resource bodies, in bytes
+_MAX_BYTES = int(os.getenv("RESOURCE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Seconds until a cached resource expires; 0 keeps resources until evicted
+_TTL = float(os.getenv("RESOURCE_CACHE_TTL", "0"))
+
+
+def _sizeof(key: str, value: Any) -> int:
+    """
+    Approximate the memory held by a cache entry.
+    """
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class ResourceCache:
+    """
+    A size-aware LRU cache with optional TTL and hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_bytes: int = _MAX_BYTES, ttl: Optional[float] = _TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # url -> (stored value, size, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get an entry and mark it as recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            stored, _, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._decode(stored)
+
+    def __setitem__(self, key: str, value: Any):
+        self.set(key, value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Store an entry, optionally with its own TTL instead of the cache's.
+        """
+        ttl = ttl or self.ttl
+        stored, size = self._encode(key, value)
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # Never let a single entry flush the whole cache
+                self._discard(stored)
+                return
+            self._entries[key] = (stored, size, expires_at)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def __contains__(self, key: str) -> bool:
+        # Checked without reading or decoding the value, and without counting a hit
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or entry[2] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """
+        Remove an entry and return its value.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._decode(self._entries[key][0])
+            self._remove(key)
+            return value
+
+    def _remove(self, key: str):
+        stored, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+        self._discard(stored)
+
+    def _encode(self, key: str, value: Any) -> Tuple[Any, int]:
+        """
+        Turn a value into what is kept in the cache, and the bytes it takes.
+        """
+        return value, _sizeof(key, value)
+
+    def _decode(self, stored: Any) -> Any:
+        """
+        Turn what is kept in the cache back into the value.
+        """
+        return stored
+
+    def _discard(self, stored: Any):
+        """
+        Release what was kept for an entry that left the cache.
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,273 @@
+"""
+Resource fetching shared by all agent stacks.
+
+The LangGraph and CrewAI flows download the same kind of resources, so they
+share one cache, one HTTP pool and one set of metrics through this module.
+Their download modules only take care of logging progress to the UI.
+"""
+import logging
+import os
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Set
+from research_canvas.convert import html_to_markdown, get_conversion_stats
+from research_canvas.persistent_cache import get_persistent_cache, StoredResource
+from research_canvas.resource_cache import ResourceCache
+from research_canvas.document_store import DocumentCache
+from research_canvas.resilience import (
+    fetch_with_retries,
+    failed_resource,
+    failure_ttl,
+    get_breaker_stats
+)
+from research_canvas.scheduler import get_scheduler
+from research_canvas.local_index import get_local_index
+from research_canvas.summaries import summarise_in_background, get_summary_stats
+
+_logger = logging.getLogger(__name__)
+
+_RESOURCE_CACHE = DocumentCache()
+# Resources that recently failed to download, each expiring after its failure TTL
+_FAILED_RESOURCES = ResourceCache(max_bytes=1024 * 1024)
+
+# Maximum number of downloads running at once for a single thread
+# (the process-wide and per-host limits are enforced by the fetch scheduler)
+_DOWNLOAD_CONCURRENCY = int(os.getenv("RESOURCE_DOWNLOAD_CONCURRENCY", "5"))
+
+# Start downloading resources as soon as a search picks them
+_PREFETCH_RESOURCES = os.getenv("PREFETCH_RESOURCES", "true").lower() == "true"
+
+# Downloads in progress, so concurrent requests for the same URL share one fetch
+_IN_FLIGHT: Dict[str, "asyncio.Task[str]"] = {}
+_STATS = {
+    "downloads": 0,
+    "coalesced": 0,
+    "prefetches": 0,
+}
+# Local index updates in progress, referenced so they are not garbage collected
+_INDEXING: Set[asyncio.Task] = set()
+
+
+def get_resource(url: str) -> str:
+    """
+    Get a resource from the cache.
+    Returns "ERROR" while a failed download is remembered.
+    """
+    content = _RESOURCE_CACHE.get(url)
+    if content is None:
+        return "ERROR" if _FAILED_RESOURCES.get(url) is not None else ""
+    return content
+
+
+def has_resource(url: str) -> bool:
+    """
+    Whether a resource is cached, or its failed download is remembered,
+    without reading its content.
+    """
+    return url in _RESOURCE_CACHE or url in _FAILED_RESOURCES
+
+
+def without_failed(resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Leave out the resources whose download failed, without loading any content.
+    """
+    return [
+        resource for resource in resources
+        if resource["url"] in _RESOURCE_CACHE or resource["url"] not in _FAILED_RESOURCES
+    ]
+
+
+async def _cache_resource(url: str, content: str):
+    """
+    Store a converted resource, compressing it off the event loop.
+    """
+    await asyncio.to_thread(_RESOURCE_CACHE.set, url, content)
+
+
+async def load_resource(url: str) -> str:
+    """
+    Get a resource from the cache, downloading it again if it was evicted.
+    A resource that converted to no text at all stays cached as "".
+    """
+    if not has_resource(url):
+        await _download_resource(url)
+    return get_resource(url)
+
+
+async def load_resources(resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Attach the content to each resource, leaving out the ones that failed to download.
+    """
+    contents = await asyncio.gather(
+        *(load_resource(resource["url"]) for resource in resources)
+    )
+    return [
+        {**resource, "content": content}
+        for resource, content in zip(resources, contents)
+        if content != "ERROR"
+    ]
+
+
+def prefetch_resource(url: str):
+    """
+    Start downloading a resource in the background unless it is cached or already in flight.
+    """
+    if _PREFETCH_RESOURCES and not has_resource(url):
+        _STATS["prefetches"] += 1
+        _start_download(url)
+
+
+def _start_download(url: str) -> "asyncio.Task[str]":
+    """
+    Get the download in flight for a URL, starting one if there is none.
+    """
+    loop = asyncio.get_running_loop()
+    task = _IN_FLIGHT.get(url)
+    if task is not None and task.get_loop() is loop:
+        _STATS["coalesced"] += 1
+        return task
+
+    _STATS["downloads"] += 1
+    task = loop.create_task(_fetch_resource(url))
+    _IN_FLIGHT[url] = task
+
+    def forget(done: "asyncio.Task[str]"):
+        if _IN_FLIGHT.get(url) is done:
+            del _IN_FLIGHT[url]
+
+    task.add_done_callback(forget)
+    return task
+
+
+async def _download_resource(url: str) -> str:
+    """
+    Download a resource, joining the download already in flight for the same URL.
+    """
+    # A cancelled caller must not cancel the download other callers are waiting for
+    return await asyncio.shield(_start_download(url))
+
+
+async def _fetch_resource(url: str) -> str:
+    """
+    Download a resource from the internet asynchronously.
+    Resources kept in the on-disk cache are served from there instead.
+    """
+    persistent_cache = get_persistent_cache()
+    stored = None
+    if persistent_cache is not None:
+        # A broken on-disk cache must not fail the download, only skip the cache
+        try:
+            stored = await persistent_cache.get(url)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error reading cached resource {url}: {e}")
+    if stored is not None:
+        await _cache_resource(url, stored.content)
+        _index_in_background(url, stored.content)
+        summarise_in_background(url, stored.content)
+        if stored.is_stale:
+            persistent_cache.revalidate_in_background(stored, _revalidate_resource)
+        return stored.content
+
+    try:
+        result = await fetch_with_retries(url)
+        conversion = await html_to_markdown(result.text)
+        markdown_content = conversion.markdown
+        _logger.debug(
+            f"Extracted {conversion.extracted_chars} of {conversion.original_chars} "
+            f"text characters from {url}"
+        )
+        await _cache_resource(url, markdown_content)
+        _FAILED_RESOURCES.pop(url)
+        _index_in_background(url, markdown_content)
+        summarise_in_background(url, markdown_content)
+    except Exception as e: # pylint: disable=broad-except
+        _FAILED_RESOURCES.set(url, failed_resource(e), ttl=failure_ttl(e))
+        return f"Error downloading resource: {e}"
+
+    if persistent_cache is not None:
+        try:
+            await persistent_cache.put(url, markdown_content, result.etag, result.last_modified)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error caching resource {url}: {e}")
+    return markdown_content
+
+
+async def _revalidate_resource(stored: StoredResource):
+    """
+    Refresh a stale on-disk resource with a conditional request.
+    """
+    persistent_cache = get_persistent_cache()
+    result = await fetch_with_retries(stored.url, stored.etag, stored.last_modified)
+    if result.not_modified:
+        await persistent_cache.touch(stored.url)
+        return
+    markdown_content = (await html_to_markdown(result.text)).markdown
+    await _cache_resource(stored.url, markdown_content)
+    _index_in_background(stored.url, markdown_content)
+    summarise_in_background(stored.url, markdown_content)
+    await persistent_cache.put(stored.url, markdown_content, result.etag, result.last_modified)
+
+
+def _index_in_background(url: str, content: str):
+    """
+    Add a converted resource to the local index without holding up the download.
+    """
+    local_index = get_local_index()
+    if local_index is None:
+        return
+
+    async def run():
+        title = next(
+            (line.lstrip("#").strip() for line in content.splitlines() if line.startswith("#")),
+            ""
+        )
+        try:
+            await asyncio.to_thread(local_index.add, url, content, title)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error indexing {url}: {e}")
+
+    task = asyncio.create_task(run())
+    _INDEXING.add(task)
+    task.add_done_callback(_INDEXING.discard)
+
+
+async def _download_bounded(index: int, url: str, semaphore: asyncio.Semaphore) -> int:
+    """
+    Download a resource while holding one of the thread's download slots.
+    Returns the index so the caller can match the completed download to its log.
+    """
+    async with semaphore:
+        await _download_resource(url)
+    return index
+
+
+async def download_as_completed(urls: List[str]) -> AsyncIterator[int]:
+    """
+    Download resources concurrently, yielding the index of each URL as it completes.
+    """
+    semaphore = asyncio.Semaphore(max(1, _DOWNLOAD_CONCURRENCY))
+    downloads = [
+        _download_bounded(i, url, semaphore)
+        for i, url in enumerate(urls)
+    ]
+    for download in asyncio.as_completed(downloads):
+        yield await download
+
+
+def get_resource_stats() -> Dict[str, Any]:
+    """
+    Get the metrics of the resource service.
+    """
+    persistent_cache = get_persistent_cache()
+    local_index = get_local_index()
+    return {
+        **_STATS,
+        "in_flight": len(_IN_FLIGHT),
+        "cache": _RESOURCE_CACHE.stats(),
+        "failures": _FAILED_RESOURCES.stats(),
+        "persistent_cache": persistent_cache.stats() if persistent_cache else None,
+        "local_index": local_index.stats() if local_index else None,
+        "conversion": get_conversion_stats(),
+        "summaries": get_summary_stats(),
+        "open_circuits": len(get_breaker_stats()),
+        "scheduler": get_scheduler().stats(),
+    }
@@ -0,0 +1,163 @@
+"""
+Per-host politeness scheduler for resource fetches.
+
+Every fetch waits for a slot that respects a global concurrency limit, a
+per-host concurrency limit, a per-host request rate and any Retry-After a
+host sent us. Waiting fetches are granted round-robin across hosts, so a
+burst of URLs from one site does not starve the others.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlparse
+from research_canvas.loop_registry import LoopRegistry
+
+# Maximum number of fetches running at once across all threads in the process
+_GLOBAL_CONCURRENCY = int(os.getenv("RESOURCE_DOWNLOAD_GLOBAL_CONCURRENCY", "20"))
+# Maximum number of fetches running at once against a single host
+_HOST_CONCURRENCY = int(os.getenv("RESOURCE_HOST_CONCURRENCY", "2"))
+# Maximum number of fetches started per second against a single host
+_HOST_RATE = float(os.getenv("RESOURCE_HOST_RATE", "2"))
+
+
+class _Host:
+    def __init__(self):
+        self.active = 0
+        self.next_start = 0.0
+        self.blocked_until = 0.0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+class HostScheduler:
+    """
+    Grants fetch slots fairly across hosts within global and per-host limits.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = _GLOBAL_CONCURRENCY,
+        host_limit: int = _HOST_CONCURRENCY,
+        host_rate: float = _HOST_RATE
+    ):
+        self.global_limit = max(1, global_limit)
+        self.host_limit = max(1, host_limit)
+        self.interval = 1 / host_rate if host_rate > 0 else 0.0
+        self.active = 0
+        self.throttled = 0
+        # Hosts in round-robin order; a host moves to the back when it gets a slot
+        self._hosts: "OrderedDict[str, _Host]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _host(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host()
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        Hold a fetch slot for a URL's host.
+        """
+        host = urlparse(url).hostname or ""
+        state = self._host(host)
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled
+                self._release(host)
+            else:
+                try:
+                    state.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def retry_after(self, url: str, seconds: float):
+        """
+        Hold back all fetches to a URL's host for the given number of seconds.
+        """
+        state = self._host(urlparse(url).hostname or "")
+        state.blocked_until = max(state.blocked_until, time.monotonic() + seconds)
+        self.throttled += 1
+
+    def _release(self, host: str):
+        self.active -= 1
+        self._hosts[host].active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Grant as many waiting fetches as the limits allow, one host at a time in turn.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        next_wakeup = None
+        granted = True
+        while granted and self.active < self.global_limit:
+            granted = False
+            for host, state in list(self._hosts.items()):
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()
+                if not state.waiters:
+                    if state.active == 0 and state.blocked_until <= now:
+                        del self._hosts[host]
+                    continue
+                if state.active >= self.host_limit:
+                    continue
+                ready_at = max(state.next_start, state.blocked_until)
+                if ready_at > now:
+                    wait = ready_at - now
+                    next_wakeup = wait if next_wakeup is None else min(next_wakeup, wait)
+                    continue
+
+                state.waiters.popleft().set_result(None)
+                state.active += 1
+                state.next_start = now + self.interval
+                self.active += 1
+                self._hosts.move_to_end(host)
+                granted = True
+                break
+
+        if next_wakeup is not None and self.active < self.global_limit:
+            self._timer = asyncio.get_running_loop().call_later(next_wakeup, self._dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the scheduler counters.
+        """
+        now = time.monotonic()
+        return {
+            "active": self.active,
+            "queued": sum(len(state.waiters) for state in self._hosts.values()),
+            "hosts": len(self._hosts),
+            "blocked_hosts": sum(
+                1 for state in self._hosts.values() if state.blocked_until > now
+            ),
+            "throttled": self.throttled,
+        }
+
+
+# Futures and timers are bound to the event loop they were created on
+_SCHEDULERS: LoopRegistry[HostScheduler] = LoopRegistry()
+
+
+def get_scheduler() -> HostScheduler:
+    """
+    Get the scheduler for the running event loop.
+    """
+    return _SCHEDULERS.get(HostScheduler)
@@ -0,0 +1,122 @@
+"""
+Compact rendering of search results for the ExtractResources call.
+
+Raw Tavily responses carry scores, raw fields and the same URLs across
+queries. Before they go into the prompt, results of all queries are merged by
+reciprocal rank fusion, URLs that are already resources are dropped, and each
+hit is rendered as title, url and a truncated snippet.
+"""
+import logging
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urldefrag
+
+# Constant of reciprocal rank fusion; higher values flatten the rank weighting
+_logger = logging.getLogger(__name__)
+
+_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+# Maximum number of fused results passed to the model
+_MAX_RESULTS = int(os.getenv("SEARCH_PAYLOAD_MAX_RESULTS", "15"))
+# Maximum length of a result snippet, in characters
+_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "300"))
+
+
+class SearchHit(NamedTuple):
+    """
+    A search result merged across queries.
+    """
+    url: str
+    title: str
+    snippet: str
+    # Reciprocal rank fusion score across queries
+    score: float
+    # Highest relevance score the search backend gave the URL
+    relevance: float
+
+
+def _url_key(url: str) -> str:
+    return urldefrag(url.strip())[0].rstrip("/")
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """
+    Collapse whitespace and cut a text at a word boundary.
+    """
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text, at about four characters per token.
+    """
+    return (len(text) + 3) // 4
+
+
+def fuse_search_results(
+    search_results: Iterable[Optional[Dict[str, Any]]],
+    exclude_urls: Iterable[str] = ()
+) -> List[SearchHit]:
+    """
+    Merge the results of several queries by reciprocal rank fusion, dropping
+    duplicates and excluded URLs.
+    """
+    excluded = {_url_key(url) for url in exclude_urls}
+    hits: Dict[str, SearchHit] = {}
+    for response in search_results:
+        for rank, result in enumerate((response or {}).get("results", [])):
+            url = result.get("url")
+            if not url:
+                continue
+            key = _url_key(url)
+            if key in excluded:
+                continue
+            score = 1 / (_RRF_K + rank + 1)
+            hit = hits.get(key)
+            if hit is None:
+                hits[key] = SearchHit(
+                    url=url,
+                    title=result.get("title") or "",
+                    snippet=result.get("content") or "",
+                    score=score,
+                    relevance=result.get("score") or 0.0
+                )
+            else:
+                # Keep the longest snippet any query returned for this URL
+                snippet = max(hit.snippet, result.get("content") or "", key=len)
+                hits[key] = hit._replace(
+                    snippet=snippet,
+                    score=hit.score + score,
+                    relevance=max(hit.relevance, result.get("score") or 0.0)
+                )
+    return sorted(hits.values(), key=lambda hit: hit.score, reverse=True)
+
+
+def compact_search_results(
+    search_results: List[Optional[Dict[str, Any]]],
+    resources: Iterable[Dict[str, Any]] = ()
+) -> str:
+    """
+    Render search results for the model, logging how many tokens this saves
+    over the raw responses.
+    """
+    hits = fuse_search_results(
+        search_results, (resource.get("url", "") for resource in resources)
+    )[:_MAX_RESULTS]
+    if hits:
+        payload = "\n".join(
+            f"{i}. {hit.title}\n{hit.url}\n{truncate_text(hit.snippet, _SNIPPET_CHARS)}"
+            for i, hit in enumerate(hits, 1)
+        )
+    else:
+        payload = "No new results."
+
+    raw_tokens = estimate_tokens(str(search_results))
+    compact_tokens = estimate_tokens(payload)
+    _logger.debug(
+        f"Compacted search results from ~{raw_tokens} to ~{compact_tokens} tokens "
+        f"({len(hits)} unique results)"
+    )
+    return payload
@@ -0,0 +1,180 @@
+"""
+Web search shared by all agent stacks.
+
+The Tavily client is synchronous, so searches run in a bounded thread pool
+instead of blocking the event loop, and all queries of one Search tool call
+run concurrently.
+
+Responses are cached by normalised query (case, punctuation, whitespace and
+word order are ignored) for SEARCH_CACHE_TTL seconds, in memory and, when
+SEARCH_CACHE_DB is set, on disk. Queries of one call that normalise to the
+same key are only sent once.
+
+When the local index is enabled (LOCAL_INDEX_DIR), a query it can answer with
+at least LOCAL_SEARCH_MIN_RESULTS documents covering LOCAL_SEARCH_MIN_COVERAGE
+of the query terms is served from it, and Tavily is not called.
+"""
+import os
+import re
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from tavily import TavilyClient
+from research_canvas.resource_cache import ResourceCache
+from research_canvas.persistent_cache import get_persistent_search_cache
+from research_canvas.local_index import get_local_index
+
+# Maximum number of Tavily requests running at once across the process
+_SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+# How long a search response is reused, in seconds
+_SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 60 * 60)))
+_SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Local results needed before a query is answered without Tavily
+_LOCAL_MIN_RESULTS = int(os.getenv("LOCAL_SEARCH_MIN_RESULTS", "3"))
+_LOCAL_MIN_COVERAGE = float(os.getenv("LOCAL_SEARCH_MIN_COVERAGE", "0.6"))
+_LOCAL_MAX_RESULTS = int(os.getenv("LOCAL_SEARCH_MAX_RESULTS", "5"))
+
+tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+_SEARCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, _SEARCH_CONCURRENCY),
+    thread_name_prefix="tavily"
+)
+
+# Normalised query -> response serialised as JSON, so hits hand out fresh copies
+_SEARCH_CACHE = ResourceCache(max_bytes=_SEARCH_CACHE_MAX_BYTES, ttl=_SEARCH_CACHE_TTL)
+_STATS = {
+    "searches": 0,
+    "local_hits": 0,
+    "tavily_requests": 0,
+    "collapsed": 0,
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Reduce a query to a cache key that ignores case, punctuation, whitespace
+    and word order.
+    """
+    words = _PUNCTUATION.sub(" ", query.lower()).split()
+    return " ".join(sorted(set(words))) or query.strip().lower()
+
+
+async def search(query: str, known_urls: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Run a Tavily search off the event loop, unless the cache or the local
+    index can answer the query. known_urls are the resources the thread already
+    has, which the local index cannot answer with.
+    """
+    _STATS["searches"] += 1
+    key = normalize_query(query)
+    cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    persistent_cache = get_persistent_search_cache()
+    if persistent_cache is not None:
+        try:
+            stored = await persistent_cache.get(key, _SEARCH_CACHE_TTL)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error reading cached search for {query}: {e}")
+            stored = None
+        if stored is not None:
+            _SEARCH_CACHE[key] = stored
+            return json.loads(stored)
+
+    local_response = await _search_local(query, set(known_urls))
+    if local_response is not None:
+        _STATS["local_hits"] += 1
+        return local_response
+
+    _STATS["tavily_requests"] += 1
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(_SEARCH_EXECUTOR, tavily_client.search, query)
+
+    serialized = json.dumps(response)
+    _SEARCH_CACHE[key] = serialized
+    if persistent_cache is not None:
+        try:
+            await persistent_cache.put(key, serialized)
+        except Exception as e: # pylint: disable=broad-except
+            print(f"Error caching search for {query}: {e}")
+    return response
+
+
+async def _search_local(query: str, known_urls: Set[str]) -> Optional[Dict[str, Any]]:
+    """
+    Answer a query from the local index, or return None if it does not know
+    enough documents beyond the known ones.
+    """
+    local_index = get_local_index()
+    if local_index is None:
+        return None
+    try:
+        hits = await asyncio.to_thread(local_index.search, query, _LOCAL_MAX_RESULTS)
+    except Exception as e: # pylint: disable=broad-except
+        print(f"Error searching the local index for {query}: {e}")
+        return None
+    # The index holds the thread's own downloads, which are no news to it
+    hits = [
+        hit for hit in hits
+        if hit.coverage >= _LOCAL_MIN_COVERAGE and hit.url not in known_urls
+    ]
+    if len(hits) < max(1, _LOCAL_MIN_RESULTS):
+        return None
+    # Shaped like a Tavily response so callers need not tell them apart
+    return {
+        "query": query,
+        "source": "local",
+        "results": [
+            {"url": hit.url, "title": hit.title, "content": hit.snippet, "score": hit.score}
+            for hit in hits
+        ],
+    }
+
+
+async def _keyed_search(
+    key: str, query: str, known_urls: Set[str]
+) -> Tuple[str, Dict[str, Any]]:
+    return key, await search(query, known_urls)
+
+
+async def search_as_completed(
+    queries: List[str],
+    known_urls: Iterable[str] = ()
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Run all queries concurrently, yielding (index, response) as each one returns.
+    Queries that normalise to the same key share one search. known_urls are
+    the resources the thread already has.
+    """
+    known_urls = set(known_urls)
+    indices: Dict[str, List[int]] = {}
+    for i, query in enumerate(queries):
+        indices.setdefault(normalize_query(query), []).append(i)
+    _STATS["collapsed"] += len(queries) - len(indices)
+
+    searches = [
+        _keyed_search(key, queries[group[0]], known_urls) for key, group in indices.items()
+    ]
+    for completed in asyncio.as_completed(searches):
+        key, response = await completed
+        for i in indices[key]:
+            yield i, response
+
+
+def get_search_stats() -> Dict[str, Any]:
+    """
+    Get search cache hit rates.
+    """
+    searches = _STATS["searches"]
+    persistent_cache = get_persistent_search_cache()
+    return {
+        **_STATS,
+        "hit_rate": 1 - _STATS["tavily_requests"] / searches if searches else 0.0,
+        "local_hit_rate": _STATS["local_hits"] / searches if searches else 0.0,
+        "cache": _SEARCH_CACHE.stats(),
+        "persistent_cache": persistent_cache.stats() if persistent_cache else None,
+    }
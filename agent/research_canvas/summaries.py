@@ -0,0 +1,146 @@
+"""
+Cached summaries of large resources.
+
+When RESOURCE_SUMMARIES is on, every resource larger than
+RESOURCE_SUMMARY_THRESHOLD tokens is summarised by OPENAI_MODEL through
+Portkey in the background once it has been downloaded. Summaries are cached
+by the SHA-256 of the content, so a page that did not change is never
+summarised twice, and chat prompts use a resource's summary in place of its
+full text once it is available.
+"""
+import os
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Set
+from litellm import acompletion
+from portkey_ai import createHeaders, PORTKEY_GATEWAY_URL
+from research_canvas.resource_cache import ResourceCache
+from research_canvas.loop_registry import LoopRegistry
+from research_canvas.prompt_budget import count_tokens, truncate_tokens
+
+_SUMMARIES = os.getenv("RESOURCE_SUMMARIES", "false").lower() == "true"
+# Resources up to this many tokens are always passed in full
+_THRESHOLD = int(os.getenv("RESOURCE_SUMMARY_THRESHOLD", "2000"))
+_SUMMARY_WORDS = int(os.getenv("RESOURCE_SUMMARY_WORDS", "250"))
+# Longer resources are cut to this many tokens before they are summarised
+_INPUT_TOKENS = int(os.getenv("RESOURCE_SUMMARY_INPUT_TOKENS", "12000"))
+_CONCURRENCY = int(os.getenv("RESOURCE_SUMMARY_CONCURRENCY", "2"))
+
+_SUMMARY_PROMPT = """
+Summarise the following source for a research assistant in at most {words} words.
+Keep the key claims, figures, dates and names. Do not add anything that is not in the source.
+"""
+
+# Content hash -> summary
+_SUMMARY_CACHE = ResourceCache(max_bytes=16 * 1024 * 1024)
+_IN_FLIGHT: Set[str] = set()
+_TASKS: Set[asyncio.Task] = set()
+_SEMAPHORES: LoopRegistry[asyncio.Semaphore] = LoopRegistry()
+_STATS = {
+    "summarised": 0,
+    "failed": 0,
+    "used": 0,
+}
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _needs_summary(content: str) -> bool:
+    return _SUMMARIES and count_tokens(content) > _THRESHOLD
+
+
+def get_summary(content: str) -> Optional[str]:
+    """
+    Get the cached summary of a resource's content, if there is one.
+    """
+    return _SUMMARY_CACHE.get(_content_hash(content))
+
+
+async def summarise(text: str, instructions: str) -> str:
+    """
+    Summarise a text with OPENAI_MODEL through Portkey, following the given instructions.
+    """
+    portkey_headers = createHeaders(
+        api_key=os.getenv("PORTKEY_API_KEY"),
+        provider="openai"
+    )
+    if os.getenv("PORTKEY_OPENAI_CONFIG"):
+        portkey_headers["x-portkey-config"] = os.getenv("PORTKEY_OPENAI_CONFIG")
+    response = await acompletion(
+        model=f"openai/{os.getenv('OPENAI_MODEL', 'gpt-4o-mini')}",
+        messages=[
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": truncate_tokens(text, _INPUT_TOKENS)},
+        ],
+        temperature=0,
+        api_key=os.getenv("PORTKEY_API_KEY"),
+        base_url=PORTKEY_GATEWAY_URL,
+        headers=portkey_headers
+    )
+    return response.choices[0].message.content or ""
+
+
+def summarise_in_background(url: str, content: str):
+    """
+    Summarise a large resource off the critical path, unless its summary is
+    cached or being produced.
+    """
+    if not _needs_summary(content):
+        return
+    content_hash = _content_hash(content)
+    if content_hash in _IN_FLIGHT or content_hash in _SUMMARY_CACHE:
+        return
+    _IN_FLIGHT.add(content_hash)
+
+    semaphore = _SEMAPHORES.get(lambda: asyncio.Semaphore(max(1, _CONCURRENCY)))
+
+    async def run():
+        try:
+            async with semaphore:
+                summary = await summarise(
+                    content, _SUMMARY_PROMPT.format(words=_SUMMARY_WORDS)
+                )
+            if summary:
+                _SUMMARY_CACHE[content_hash] = summary
+                _STATS["summarised"] += 1
+        except Exception as e: # pylint: disable=broad-except
+            _STATS["failed"] += 1
+            print(f"Error summarising {url}: {e}")
+        finally:
+            _IN_FLIGHT.discard(content_hash)
+
+    task = loop.create_task(run())
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+
+
+def use_summaries(resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace the content of large resources with their summaries where one is ready.
+    """
+    if not _SUMMARIES:
+        return resources
+    summarised = []
+    for resource in resources:
+        content = resource.get("content") or ""
+        summary = get_summary(content) if _needs_summary(content) else None
+        if summary is None:
+            summarised.append(resource)
+            continue
+        _STATS["used"] += 1
+        summarised.append({**resource, "content": f"Summary: {summary}"})
+    return summarised
+
+
+def get_summary_stats() -> Dict[str, Any]:
+    """
+    Get the summary counters.
+    """
+    return {
+        **_STATS,
+        "enabled": _SUMMARIES,
+        "in_flight": len(_IN_FLIGHT),
+        "cache": _SUMMARY_CACHE.stats(),
+    }
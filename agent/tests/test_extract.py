@@ -0,0 +1,45 @@
+"""
+Tests for main-content extraction.
+"""
+from research_canvas.extract import extract_main_content
+
+_ARTICLE = " ".join(["The committee published its findings on the river survey."] * 20)
+
+_SCRIPT_HEAVY_PAGE = f"""
+<html>
+<head>
+<script>{"window.__state = {'items': [1, 2, 3]};" * 5000}</script>
+<style>{"body {{ margin: 0; }}" * 2000}</style>
+<script type="application/ld+json">{'{"@type": "NewsArticle"}' * 2000}</script>
+</head>
+<body>
+<nav><a href="/">Home</a> <a href="/news">News</a></nav>
+<div class="cookie-banner">We use cookies to improve your experience.</div>
+<main><h1>River survey</h1><p>{_ARTICLE}</p></main>
+<template><p>{"Hidden template text. " * 500}</p></template>
+<footer>Copyright</footer>
+<script>{"track('view');" * 5000}</script>
+</body>
+</html>
+"""
+
+
+def test_inline_scripts_do_not_count_as_page_text():
+    extraction = extract_main_content(_SCRIPT_HEAVY_PAGE)
+
+    assert extraction.html != _SCRIPT_HEAVY_PAGE
+    assert "River survey" in extraction.html
+    assert "cookies" not in extraction.html
+    assert "News</a>" not in extraction.html
+    assert "window.__state" not in extraction.html
+    assert extraction.extracted_chars < extraction.original_chars
+    # Only the visible text counts towards the page total
+    assert extraction.original_chars < len(_ARTICLE) * 2
+
+
+def test_falls_back_when_main_content_is_dropped():
+    page = f"<html><body><div class='sidebar'><p>{_ARTICLE}</p></div><p>Hi</p></body></html>"
+
+    extraction = extract_main_content(page)
+
+    assert extraction.html == page